@@ -0,0 +1,86 @@
+"""
+Compare stored & virtual availability occurrences
+
+Creates a lot of schedules with a simple weekly availability, then times
+free time reads with occurrences stored for the next 100 days, and again
+with ``materialize_occurrences = False``. Run it from the project root::
+
+    python benchmarks/virtual_occurrences.py --schedules 500
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+from unittest import mock
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+
+HORIZON = timedelta(days=100)
+
+
+def time_reads(schedules, start, window):
+    from django_agenda.models import get_free_times
+
+    began = perf_counter()
+    for schedule in schedules:
+        get_free_times(schedule, start, start + window)
+    return (perf_counter() - began) / len(schedules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--schedules", type=int, default=200)
+    parser.add_argument("--window", type=int, default=7, help="days to read")
+    args = parser.parse_args()
+
+    django.setup()
+    import pytz
+    from django.contrib.auth.models import User
+    from django_agenda.virtual import expansion_cache
+    from tests import models
+
+    start = pytz.utc.localize(datetime(2020, 1, 6))
+    window = timedelta(days=args.window)
+    zone = pytz.timezone("America/Vancouver")
+    schedules = []
+    for idx in range(args.schedules):
+        user = User.objects.create(username="provider{}".format(idx))
+        models.Availability.objects.create(
+            schedule=user,
+            start_date=date(2020, 1, 1),
+            start_time=time(9),
+            end_time=time(17),
+            recurrence="RRULE:FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+            timezone=zone,
+        )
+        schedules.append(user)
+
+    began = perf_counter()
+    for availability in models.Availability.objects.all():
+        availability.recreate_occurrences(start, start + HORIZON)
+    generate = perf_counter() - began
+    rows = models.AvailabilityOccurrence.objects.count()
+    stored = time_reads(schedules, start, window)
+
+    models.AvailabilityOccurrence.objects.all().delete()
+    with mock.patch.object(
+        models.Availability.AgendaMeta, "materialize_occurrences", False, create=True
+    ):
+        expansion_cache.clear()
+        cold = time_reads(schedules, start, window)
+        warm = time_reads(schedules, start, window)
+
+    print("schedules:            {}".format(args.schedules))
+    print("stored occurrences:   {} rows, {:.2f}s to generate".format(rows, generate))
+    print("virtual occurrences:  0 rows, {} cached blocks".format(len(expansion_cache)))
+    print("read latency (stored):       {:.3f} ms".format(stored * 1000))
+    print("read latency (virtual cold): {:.3f} ms".format(cold * 1000))
+    print("read latency (virtual warm): {:.3f} ms".format(warm * 1000))
+
+
+if __name__ == "__main__":
+    main()
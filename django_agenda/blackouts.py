@@ -0,0 +1,210 @@
+"""
+Blackouts shared by many schedules
+
+Public holidays and building closures apply to lots of schedules at once.
+Rather than booking a busy time slot in every schedule, create a blackout
+model::
+
+    class Blackout(AbstractBlackout):
+        class AgendaMeta:
+            schedule_model = Clinic
+
+and link each blackout to the schedules it applies to (``schedules``), or
+set ``all_schedules``. Free times, booking validation, slot grids, iCalendar
+exports and utilization totals all leave out blacked out time.
+
+Blackouts rarely change, so each process reads all the current & upcoming
+ones at once and caches them, per database (reads go to the same database
+as the schedule's other reads, see `django_agenda.routing`). Ranges that
+reach back to older blackouts read those from the database. Saving or
+deleting a blackout, or changing its schedules, bumps a generation that's
+kept in the cache named by ``AGENDA_CACHE``, which every process checks
+before using what it has cached. Changes that bypass ``save`` (like
+``QuerySet.update``) get noticed within ``AGENDA_BLACKOUT_CACHE_TIMEOUT``
+seconds (300 by default).
+
+Those changes also bump the agenda versions of the linked schedules, and
+get recorded in the change feed (see `django_agenda.changes`). Blackouts
+that apply to every schedule bump a version that all the schedules of that
+type share instead.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import django.utils.timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max, Q
+
+from .routing import get_read_database
+from .time_span import TimeSpan
+
+__all__ = ["get_blackouts", "get_schedule_blackouts"]
+
+DEFAULT_CACHE_TIMEOUT = 300
+# how long before it's loaded that a cached blackout can have ended
+HISTORY = timedelta(days=1)
+GENERATION_KEY = "django_agenda:blackouts"
+
+
+def _get_cache():
+    return caches[getattr(settings, "AGENDA_CACHE", "default")]
+
+
+class _Blackouts(NamedTuple):
+    #: merged spans that apply to all schedules
+    shared: List[TimeSpan]
+    #: merged spans that apply to each linked schedule, including shared
+    by_schedule: Dict[object, List[TimeSpan]]
+    loaded_at: float
+    #: the shared generation from before it was loaded
+    generation: Optional[int]
+    #: blackouts that ended before this aren't included
+    since: datetime
+    #: when the last of the blackouts that aren't included ended
+    past_until: Optional[datetime]
+
+
+class BlackoutCache:
+    """
+    A thread safe cache of the recent & upcoming blackouts of each blackout
+    model and database
+    """
+
+    def __init__(self, timeout: float = None):
+        self._timeout = timeout
+        self._data = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> float:
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, "AGENDA_BLACKOUT_CACHE_TIMEOUT", DEFAULT_CACHE_TIMEOUT)
+
+    def get(self, model, using: str = None) -> _Blackouts:
+        now = time.monotonic()
+        shared_generation = _get_cache().get(GENERATION_KEY)
+        with self._lock:
+            entry = self._data.get((model, using))
+            generation = self._generation
+        if (
+            entry is None
+            or entry.generation != shared_generation
+            or now - entry.loaded_at >= self.timeout
+        ):
+            entry = self._load(model, using, now, shared_generation)
+            with self._lock:
+                # don't keep what was read before the cache got cleared
+                if generation == self._generation:
+                    self._data[(model, using)] = entry
+        return entry
+
+    @staticmethod
+    def _load(model, using: str, now: float, generation: int) -> _Blackouts:
+        since = django.utils.timezone.now() - HISTORY
+        queryset = model.objects.using(using)
+        past_until = queryset.filter(end__lte=since).aggregate(end=Max("end"))["end"]
+        shared, by_schedule = _group_blackouts(queryset.filter(end__gt=since))
+        return _Blackouts(shared, by_schedule, now, generation, since, past_until)
+
+    def clear(self):
+        """
+        Forget what this process has cached
+        """
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def invalidate(self):
+        """
+        Make every process reload the blackouts
+        """
+        cache = _get_cache()
+        cache.add(GENERATION_KEY, 0, timeout=None)
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            # evicted in between
+            cache.set(GENERATION_KEY, 1, timeout=None)
+        self.clear()
+
+
+blackout_cache = BlackoutCache()
+
+
+def _group_blackouts(queryset) -> tuple:
+    """
+    Return the merged blackouts that apply to all schedules, and the ones
+    that apply to each linked schedule (including the shared ones)
+    """
+    shared = []
+    linked = defaultdict(list)
+    rows = queryset.values_list("start", "end", "all_schedules", "schedules")
+    for start, end, all_schedules, schedule_id in rows:
+        if all_schedules:
+            shared.append(TimeSpan(start, end))
+        elif schedule_id is not None:
+            linked[schedule_id].append(TimeSpan(start, end))
+    shared = TimeSpan.merge_spans(shared)
+    by_schedule = {
+        schedule_id: TimeSpan.merge_spans(spans + shared)
+        for schedule_id, spans in linked.items()
+    }
+    return shared, by_schedule
+
+
+def get_blackouts(
+    schedule, start: datetime, end: datetime, using: str = None
+) -> List[TimeSpan]:
+    """
+    Return the merged blackouts of a schedule that overlap start-end, sorted
+    by start
+
+    :param using: The database to read from, see
+        `django_agenda.models.get_free_times`
+    """
+    return get_schedule_blackouts([schedule], start, end, using)[schedule.pk]
+
+
+def get_schedule_blackouts(
+    schedules: Iterable, start: datetime, end: datetime, using: str = None
+) -> Dict[object, List[TimeSpan]]:
+    """
+    Return the merged blackouts of each schedule that overlap start-end,
+    by schedule primary key
+
+    The schedules are grouped by the database they're read from. Ranges that
+    reach back to blackouts that ended before what's cached are read from
+    the database, with a query per database.
+    """
+    schedules = list(schedules)
+    blackouts = getattr(schedules[0], "blackouts", None) if schedules else None
+    if blackouts is None:
+        return {schedule.pk: [] for schedule in schedules}
+    model = blackouts.model
+    databases = defaultdict(list)
+    for schedule in schedules:
+        databases[using or get_read_database(schedule, model)].append(schedule.pk)
+    result = {}
+    for database, pks in databases.items():
+        entry = blackout_cache.get(model, database)
+        shared, by_schedule = entry.shared, entry.by_schedule
+        if entry.past_until is not None and start < entry.past_until:
+            shared, by_schedule = _group_blackouts(
+                model.objects.using(database).filter(
+                    Q(all_schedules=True) | Q(schedules__in=pks),
+                    end__gt=start,
+                    start__lt=end,
+                )
+            )
+        for pk in pks:
+            spans = by_schedule.get(pk, shared)
+            result[pk] = [
+                span for span in spans if span.end > start and span.start < end
+            ]
+    return result
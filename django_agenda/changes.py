@@ -0,0 +1,105 @@
+"""
+A feed of the times at which schedules changed
+
+Search indexes and caches of free times need to know when a schedule's free
+time changes. With::
+
+    AGENDA_CHANGE_FEED = True
+
+every change that django-agenda makes to occurrences or time slots (saving
+or deleting availabilities & bookings, padding changes, regenerating
+occurrences) also writes `AgendaChange` rows: the schedule, the range of
+time that changed, and what kind of change it was. They're written in the
+same transaction as the change itself (an "outbox"), so they're never lost
+or recorded for changes that got rolled back.
+
+Consumers read the feed in batches, and keep track of how far they got::
+
+    cursor = load_cursor()
+    while True:
+        batch = read_changes(after=cursor)
+        if not batch.changes:
+            break
+        for (_type, schedule_id), spans in dirty_ranges(batch.changes).items():
+            reindex(schedule_id, spans)
+        cursor = batch.cursor
+        save_cursor(cursor)
+
+Changes to blackouts that apply to every schedule are recorded once, with
+a schedule id of `AgendaChange.ALL_SCHEDULES`.
+
+Changes stay around until they're deleted with `prune_changes`, once every
+consumer has read them. With a shard resolver, each database has its own
+feed, so read each one with ``using``.
+
+Change ids are handed out as rows get inserted, so with several writers a
+change can commit after one with a higher id. Consumers that can't afford
+to miss those should read up to the end of the feed, and re-read the last
+few seconds' worth of changes on their next run.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from .models import AgendaChange
+from .time_span import TimeSpan
+
+__all__ = ["ChangeBatch", "read_changes", "dirty_ranges", "prune_changes"]
+
+
+class ChangeBatch(NamedTuple):
+    """
+    A batch of changes from `read_changes`
+    """
+
+    changes: List[AgendaChange]
+    #: pass this as ``after`` to get the next batch
+    cursor: int
+
+
+def read_changes(after: int = 0, size: int = 500, using: str = None) -> ChangeBatch:
+    """
+    Return up to size changes that were recorded after the cursor, oldest
+    first
+
+    :param after: The cursor of the previous batch, or 0 to start at the
+        beginning of the feed
+    :returns: The changes, and the cursor to read the next batch after.
+        When there are no new changes, the cursor stays the same.
+    """
+    queryset = AgendaChange.objects.filter(id__gt=after).order_by("id")
+    if using is not None:
+        queryset = queryset.using(using)
+    changes = list(queryset[:size])
+    if not changes:
+        return ChangeBatch(changes, after)
+    return ChangeBatch(changes, changes[-1].id)
+
+
+def dirty_ranges(
+    changes: Iterable[AgendaChange],
+) -> Dict[Tuple[str, str], List[TimeSpan]]:
+    """
+    Merge changes into the ranges of each schedule that need recomputing
+
+    :returns: An ordered dictionary mapping ``(schedule_type, schedule_id)``
+        to the merged spans of time that changed, sorted by start
+    """
+    spans = OrderedDict()
+    for change in changes:
+        key = (change.schedule_type, change.schedule_id)
+        spans.setdefault(key, []).append(TimeSpan(change.start, change.end))
+    return OrderedDict(
+        (key, TimeSpan.merge_spans(value)) for key, value in spans.items()
+    )
+
+
+def prune_changes(through: int, using: str = None) -> int:
+    """
+    Delete the changes up to and including the cursor
+
+    :returns: The number of changes deleted
+    """
+    queryset = AgendaChange.objects.filter(id__lte=through)
+    if using is not None:
+        queryset = queryset.using(using)
+    return queryset.delete()[0]
@@ -0,0 +1,340 @@
+"""
+iCalendar import & export
+
+The export lets people subscribe to a schedule from their calendar app. The
+document is generated straight from ordered database cursors, so large
+schedules don't need to be loaded into memory::
+
+    def schedule_ics(request, room_id):
+        room = get_object_or_404(Room, pk=room_id)
+        start = django.utils.timezone.now()
+        return ics_response(request, room, start, start + timedelta(days=60))
+
+Two flavours are supported. ``VFREEBUSY`` produces a single free/busy
+component, with the free times as free periods and the busy time slots as
+busy periods. ``VEVENT`` produces an event per
+busy time slot and per free span, which is more widely supported by
+calendar apps.
+
+The import goes the other way, turning the events in an existing calendar
+into availability field values, which can then be fed to
+``AbstractAvailability.bulk_import``::
+
+    with open("clinic.ics") as f:
+        items = parse_ics(f.read(), default_timezone=clinic_zone)
+    result = Availability.bulk_import(clinic, items, start, end)
+    print("{:.0f} rows/s".format(result.rows_per_second))
+"""
+import calendar
+import re
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+import django.utils.timezone
+import pytz
+import recurrence
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import get_agenda_etag, get_agenda_modified, iter_free_times
+from .time_span import TimeSpan
+
+__all__ = [
+    "VFREEBUSY",
+    "VEVENT",
+    "iter_ics",
+    "get_last_modified",
+    "ics_response",
+    "parse_rrule",
+    "parse_ics",
+]
+
+VFREEBUSY = "VFREEBUSY"
+VEVENT = "VEVENT"
+
+PRODID = "-//django-agenda//EN"
+CRLF = "\r\n"
+
+
+def format_datetime(value: datetime) -> str:
+    return value.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def get_last_modified(schedule) -> Optional[datetime]:
+    """
+    Return the last time that a schedule's agenda changed
+
+    This is when its version was last bumped (see
+    `django_agenda.models.get_agenda_modified`), which covers every change
+    that django-agenda makes, including deletes and bulk updates. It
+    returns ``None`` if there's nothing to go by.
+    """
+    return get_agenda_modified(schedule)
+
+
+def iter_ics(
+    schedule,
+    start: datetime,
+    end: datetime,
+    component: str = VFREEBUSY,
+    dtstamp: Optional[datetime] = None,
+) -> Iterator[str]:
+    """
+    Yield the lines of an iCalendar document for a schedule
+
+    Each line is terminated with a CRLF.
+
+    :param component: Either `VFREEBUSY` or `VEVENT`
+    :param dtstamp: The time stamp to put on the components, defaults to
+        the current time
+    """
+    if component not in (VFREEBUSY, VEVENT):
+        raise ValueError("Unknown component: {}".format(component))
+    if dtstamp is None:
+        dtstamp = django.utils.timezone.now()
+    stamp = format_datetime(dtstamp)
+    uid_suffix = "{}-{}@django-agenda".format(schedule._meta.label_lower, schedule.pk)
+
+    free_spans = (
+        TimeSpan(max(f_start, start), min(f_end, end))
+        for f_start, f_end in iter_free_times(schedule, start, end)
+        if f_end > start and f_start < end
+    )
+    busy_slots = (
+        (slot_id, max(b_start, start), min(b_end, end))
+        for slot_id, b_start, b_end in schedule.time_slots.filter(
+            busy=True, end__gt=start, start__lt=end
+        )
+        .order_by("start")
+        .values_list("id", "start", "end")
+        .iterator()
+    )
+
+    yield "BEGIN:VCALENDAR" + CRLF
+    yield "VERSION:2.0" + CRLF
+    yield "PRODID:" + PRODID + CRLF
+    if component == VFREEBUSY:
+        yield "BEGIN:VFREEBUSY" + CRLF
+        yield "UID:freebusy-" + uid_suffix + CRLF
+        yield "DTSTAMP:" + stamp + CRLF
+        yield "DTSTART:" + format_datetime(start) + CRLF
+        yield "DTEND:" + format_datetime(end) + CRLF
+        for f_start, f_end in free_spans:
+            yield "FREEBUSY;FBTYPE=FREE:{}/{}{}".format(
+                format_datetime(f_start), format_datetime(f_end), CRLF
+            )
+        for _id, b_start, b_end in busy_slots:
+            yield "FREEBUSY;FBTYPE=BUSY:{}/{}{}".format(
+                format_datetime(b_start), format_datetime(b_end), CRLF
+            )
+        yield "END:VFREEBUSY" + CRLF
+    else:
+        for f_start, f_end in free_spans:
+            yield "BEGIN:VEVENT" + CRLF
+            yield "UID:free-{}-{}{}".format(
+                calendar.timegm(f_start.utctimetuple()), uid_suffix, CRLF
+            )
+            yield "DTSTAMP:" + stamp + CRLF
+            yield "DTSTART:" + format_datetime(f_start) + CRLF
+            yield "DTEND:" + format_datetime(f_end) + CRLF
+            yield "SUMMARY:Available" + CRLF
+            yield "TRANSP:TRANSPARENT" + CRLF
+            yield "END:VEVENT" + CRLF
+        for slot_id, b_start, b_end in busy_slots:
+            yield "BEGIN:VEVENT" + CRLF
+            yield "UID:slot-{}-{}{}".format(slot_id, uid_suffix, CRLF)
+            yield "DTSTAMP:" + stamp + CRLF
+            yield "DTSTART:" + format_datetime(b_start) + CRLF
+            yield "DTEND:" + format_datetime(b_end) + CRLF
+            yield "SUMMARY:Busy" + CRLF
+            yield "TRANSP:OPAQUE" + CRLF
+            yield "END:VEVENT" + CRLF
+    yield "END:VCALENDAR" + CRLF
+
+
+def ics_response(
+    request, schedule, start: datetime, end: datetime, component: str = VFREEBUSY
+):
+    """
+    Return a streaming iCalendar response, honouring ``If-None-Match`` and
+    ``If-Modified-Since``
+
+    If the schedule hasn't changed since the client last asked, this returns
+    a 304 after only looking up the schedule's version (or when it was last
+    bumped, for clients that don't send an ETag).
+    """
+    etag = None
+    if "HTTP_IF_NONE_MATCH" in request.META:
+        etag = get_agenda_etag(schedule)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+    last_modified = get_last_modified(schedule)
+    timestamp = None
+    if last_modified is not None:
+        timestamp = calendar.timegm(last_modified.utctimetuple())
+        if etag is None:
+            response = get_conditional_response(request, last_modified=timestamp)
+            if response is not None:
+                return response
+    if etag is None:
+        etag = get_agenda_etag(schedule)
+
+    response = StreamingHttpResponse(
+        iter_ics(schedule, start, end, component, dtstamp=last_modified),
+        content_type="text/calendar; charset=utf-8",
+    )
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+_DURATION_RE = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+
+_UNTIL_RE = re.compile(r"UNTIL=([0-9TZ]+)")
+
+
+def _parse_duration(value: str) -> timedelta:
+    match = _DURATION_RE.match(value)
+    if match is None:
+        raise ValueError("Invalid duration: {}".format(value))
+    parts = {k: int(v) for k, v in match.groupdict().items() if v and k != "sign"}
+    result = timedelta(**parts)
+    return -result if match.group("sign") == "-" else result
+
+
+def _parse_datetime(value: str, zone) -> datetime:
+    """
+    Parse an iCalendar date-time, returning it in the given zone
+    """
+    if value.endswith("Z"):
+        return pytz.utc.localize(datetime.strptime(value, "%Y%m%dT%H%M%SZ")).astimezone(
+            zone
+        )
+    return zone.localize(datetime.strptime(value, "%Y%m%dT%H%M%S"))
+
+
+def _unfold(text: str) -> Iterator[str]:
+    """
+    Yield the content lines of an iCalendar document, unfolded
+    """
+    current = None
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _split_line(line: str):
+    """
+    Split a content line into its name, parameters and value
+    """
+    head, _sep, value = line.partition(":")
+    name, *raw_params = head.split(";")
+    params = {}
+    for param in raw_params:
+        key, _sep, param_value = param.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def parse_rrule(lines: List[str], start: datetime, end: datetime) -> dict:
+    """
+    Make availability field values from a start, end & recurrence lines
+
+    :param lines: ``RRULE``, ``EXRULE``, ``RDATE`` & ``EXDATE`` lines, as
+        they appear in an iCalendar document. Dates without a ``Z`` are
+        taken to be in the time zone of start.
+    :param start: The (aware) start of the first occurrence
+    :param end: The (aware) end of the first occurrence, on the same day
+    """
+    zone = start.tzinfo
+    # pytz zones need to be looked up again to get rid of the specific offset
+    if getattr(zone, "zone", None):
+        zone = pytz.timezone(zone.zone)
+    end = end.astimezone(zone)
+    if end.date() != start.date() or end <= start:
+        raise ValueError("Availabilities must start & end on the same day")
+
+    def naive(value):
+        if value.tzinfo is not None:
+            value = value.astimezone(zone).replace(tzinfo=None)
+        return value
+
+    result = recurrence.Recurrence()
+    for line in lines:
+        name, params, value = _split_line(line)
+        if name in ("RRULE", "EXRULE"):
+            rule = recurrence.deserialize("RRULE:" + value).rrules[0]
+            until = _UNTIL_RE.search(value)
+            if until is not None:
+                if "T" in until.group(1):
+                    rule.until = naive(_parse_datetime(until.group(1), zone))
+                else:
+                    # a date means the whole day is included
+                    rule.until = datetime.strptime(
+                        until.group(1), "%Y%m%d"
+                    ) + timedelta(days=1, seconds=-1)
+            (result.rrules if name == "RRULE" else result.exrules).append(rule)
+        elif name in ("RDATE", "EXDATE"):
+            date_zone = pytz.timezone(params["TZID"]) if "TZID" in params else zone
+            dates = [naive(_parse_datetime(v, date_zone)) for v in value.split(",")]
+            (result.rdates if name == "RDATE" else result.exdates).extend(dates)
+    return {
+        "start_date": start.date(),
+        "start_time": start.time(),
+        "end_time": end.time(),
+        "recurrence": result,
+        "timezone": zone,
+    }
+
+
+def parse_ics(text: str, default_timezone=pytz.utc) -> Iterator[dict]:
+    """
+    Yield availability field values for each event in an iCalendar document
+
+    All-day events are skipped, since availabilities need a start and end
+    time.
+
+    :param default_timezone: The time zone for times that don't specify one
+    """
+    event = None
+    for line in _unfold(text):
+        name, params, value = _split_line(line)
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {"rules": []}
+        elif event is None:
+            continue
+        elif name == "END" and value.upper() == "VEVENT":
+            if "start" in event:
+                end = event.get("end")
+                if end is None:
+                    end = event["start"] + event.get("duration", timedelta(0))
+                yield parse_rrule(event["rules"], event["start"], end)
+            event = None
+        elif name in ("DTSTART", "DTEND"):
+            if params.get("VALUE") == "DATE" or "T" not in value:
+                # all-day events don't make sense as availabilities
+                event = None
+                continue
+            zone = default_timezone
+            if "TZID" in params:
+                zone = pytz.timezone(params["TZID"])
+            event["start" if name == "DTSTART" else "end"] = _parse_datetime(
+                value, zone
+            )
+        elif name == "DURATION":
+            event["duration"] = _parse_duration(value)
+        elif name in ("RRULE", "EXRULE", "RDATE", "EXDATE"):
+            event["rules"].append(line)
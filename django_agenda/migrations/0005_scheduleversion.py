@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_agenda', '0004_rewrite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleVersion',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True,
+                    serialize=False, verbose_name='ID')),
+                ('schedule_type', models.CharField(max_length=100)),
+                ('schedule_id', models.CharField(max_length=64)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('schedule_type', 'schedule_id')},
+            },
+        ),
+    ]
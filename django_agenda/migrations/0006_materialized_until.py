@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_agenda', '0005_scheduleversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduleversion',
+            name='materialized_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
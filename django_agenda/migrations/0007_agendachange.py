@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_agenda', '0006_materialized_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgendaChange',
+            fields=[
+                ('id', models.BigAutoField(
+                    primary_key=True, serialize=False)),
+                ('schedule_type', models.CharField(max_length=100)),
+                ('schedule_id', models.CharField(max_length=64)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('kind', models.CharField(
+                    choices=[('availability', 'Availability'),
+                             ('booking', 'Booking'),
+                             ('padding', 'Padding')],
+                    max_length=12)),
+            ],
+        ),
+    ]
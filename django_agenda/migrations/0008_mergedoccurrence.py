@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_agenda', '0007_agendachange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MergedOccurrence',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True,
+                    serialize=False, verbose_name='ID')),
+                ('schedule_type', models.CharField(max_length=100)),
+                ('schedule_id', models.CharField(max_length=64)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+            ],
+            options={
+                'index_together': {('schedule_type', 'schedule_id', 'start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MergedOccurrenceSource',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True,
+                    serialize=False, verbose_name='ID')),
+                ('availability_id', models.CharField(max_length=64)),
+                ('occurrence', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='sources',
+                    to='django_agenda.MergedOccurrence')),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_agenda', '0008_mergedoccurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduleversion',
+            name='modified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
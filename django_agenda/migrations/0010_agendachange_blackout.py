@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_agenda', '0009_modified_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agendachange',
+            name='kind',
+            field=models.CharField(
+                choices=[('availability', 'Availability'),
+                         ('booking', 'Booking'),
+                         ('padding', 'Padding'),
+                         ('blackout', 'Blackout')],
+                max_length=12),
+        ),
+    ]
@@ -22,31 +22,76 @@ Each of these models has a generic relation to a "schedule" model.
 An owner can be anything: a user, a group, a locations. You specify
 this model in the Meta options.
 """
+import copy
+import heapq
 import warnings
+from collections import defaultdict
 from datetime import date, datetime, timedelta
-from typing import List
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import django.utils.timezone
 import pytz
+import recurrence
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from django.db import models, transaction
+from django.db import IntegrityError, connections, models, router, transaction
 from django.db.models.base import ModelBase
+from django.db.models.functions import Coalesce
 from django.utils.dateformat import DateFormat, TimeFormat
 from django.utils.translation import gettext_lazy as _
+from recurrence.base import normalize_offset_awareness
 from recurrence.fields import RecurrenceField
 from timezone_field import TimeZoneField
 
+from .blackouts import blackout_cache, get_blackouts
+from .routing import (
+    get_read_database,
+    get_schedule_database,
+    get_schedule_model,
+    mark_schedule_written,
+)
+from .sql import get_free_times_sql, supports_window_functions
 from .time_span import AbstractTimeSpan, TimeSpan, PaddedTimeSpan
+from .virtual import get_availabilities, get_occurrences, is_materialized
 
 __all__ = [
     "AbstractAvailability",
     "AbstractAvailabilityOccurrence",
     "AbstractTimeSlot",
     "AbstractBooking",
+    "AbstractBlackout",
+    "AgendaChange",
+    "MergedOccurrence",
+    "MergedOccurrenceSource",
+    "BulkImportResult",
+    "ScheduleVersion",
+    "Page",
+    "TimeSlotQuerySet",
+    "BookingQuerySet",
+    "TimeSpanQuerySet",
     "get_free_times",
+    "iter_free_times",
+    "get_slot_grid",
+    "suggest_slots",
+    "SlotSuggestion",
+    "get_agenda_version",
+    "get_agenda_etag",
+    "get_agenda_modified",
+    "extend_occurrences",
+    "merge_all_occurrences",
+    "pack_slot_grid",
 ]
 
+# the least that `extend_occurrences` generates at once
+EXTENSION_STEP = timedelta(days=30)
+# how much of an availability's occurrences get generated at once
+GENERATION_CHUNK = timedelta(days=31)
+# chunks with more separate changes than this report one span
+MAX_CHUNK_CHANGES = 16
+# the end of change feed ranges that don't have one
+FAR_FUTURE = datetime(9999, 12, 31, tzinfo=pytz.utc)
+
 
 # Old stub models
 # These are just here for a little extra verbosity, if you were using
@@ -67,6 +112,69 @@ class TimeSlot(models.Model):
         managed = False
 
 
+# bookkeeping models
+class ScheduleVersion(models.Model):
+    """
+    A counter that goes up every time a schedule's agenda changes
+
+    It's bumped in the same transaction as the occurrence & time slot
+    writes, so it's always safe to use as an ETag. It also tracks how far
+    the schedule's occurrences have been generated (see
+    `extend_occurrences`).
+    """
+
+    schedule_type = models.CharField(max_length=100)
+    schedule_id = models.CharField(max_length=64)
+    version = models.BigIntegerField(default=0)
+    materialized_until = models.DateTimeField(blank=True, null=True)
+    modified_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = (("schedule_type", "schedule_id"),)
+
+    def __str__(self):
+        return "{}:{} v{}".format(self.schedule_type, self.schedule_id, self.version)
+
+
+class AgendaChange(models.Model):
+    """
+    A range of time in which a schedule's agenda changed
+
+    These get written in the same transaction as the change itself, when
+    ``AGENDA_CHANGE_FEED`` is on. See `django_agenda.changes` for reading
+    them.
+    """
+
+    #: the availability occurrences changed
+    AVAILABILITY = "availability"
+    #: booked time slots changed
+    BOOKING = "booking"
+    #: just the padding around booked time slots changed
+    PADDING = "padding"
+    #: a blackout, or the schedules it applies to, changed
+    BLACKOUT = "blackout"
+    KIND_CHOICES = (
+        (AVAILABILITY, _("Availability")),
+        (BOOKING, _("Booking")),
+        (PADDING, _("Padding")),
+        (BLACKOUT, _("Blackout")),
+    )
+    #: the schedule id of changes to every schedule of a type
+    ALL_SCHEDULES = "*"
+
+    id = models.BigAutoField(primary_key=True)
+    schedule_type = models.CharField(max_length=100)
+    schedule_id = models.CharField(max_length=64)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+
+    def __str__(self):
+        return "{}:{} {} {} - {}".format(
+            self.schedule_type, self.schedule_id, self.kind, self.start, self.end
+        )
+
+
 # abstract model classes
 class Meta(ModelBase):
     """A metaclass for abstract models that orchestrates the relationships
@@ -113,6 +221,26 @@ class Meta(ModelBase):
     def get_schedule(model):
         return getattr(model, Meta.get_schedule_field(model))
 
+    @staticmethod
+    def get_schedule_key(instance):
+        """
+        Return the schedule model & id, without fetching the schedule
+        """
+        field = instance._meta.get_field(Meta.get_schedule_field(instance))
+        return field.related_model, getattr(instance, field.attname)
+
+    @staticmethod
+    def get_schedule_params(model, instance) -> dict:
+        """
+        Return keyword arguments for creating rows of model in the same
+        schedule as instance
+
+        This uses the schedule's id, so the schedule doesn't get fetched,
+        and it can live on a different database.
+        """
+        field = model._meta.get_field(Meta.get_schedule_field(model))
+        return {field.attname: Meta.get_schedule_key(instance)[1]}
+
     @staticmethod
     def get_schedule_model(model):
         meta = getattr(model, "AgendaMeta", None)
@@ -186,6 +314,16 @@ class TimeSlotMeta(Meta):
                         related_name=related_name,
                     ),
                 )
+            # for paging through a schedule's time slots, see
+            # `TimeSlotQuerySet.page`
+            schedule_field = Meta.get_schedule_field(model)
+            for fields in (
+                [schedule_field, "start", "id"],
+                [schedule_field, "padding_for", "start", "id"],
+            ):
+                index = models.Index(fields=fields)
+                index.set_name_with_model(model)
+                meta.indexes.append(index)
 
         return model
 
@@ -204,17 +342,324 @@ class TimeSlotMeta(Meta):
         return result
 
 
-def get_free_times(schedule, start: datetime, end: datetime) -> List[TimeSpan]:
-    aos = schedule.availability_occurrences.filter(end__gt=start, start__lt=end)
-    spans = list(TimeSpan.merge_spans((TimeSpan(ao.start, ao.end) for ao in aos)))
+class BlackoutMeta(ModelBase):
+    """
+    A metaclass for blackouts, which adds a many to many field for the
+    schedules they apply to
+    """
 
-    if spans:
-        busy_slots = list(
+    def __new__(mcs, name, bases, attrs):
+        model = super().__new__(mcs, name, bases, attrs)
+        meta = model._meta
+        if not meta.abstract:
+            try:
+                meta.get_field("schedules")
+            except models.FieldDoesNotExist:
+                model.add_to_class(
+                    "schedules",
+                    models.ManyToManyField(
+                        to=Meta.get_schedule_model(model),
+                        blank=True,
+                        related_name="blackouts",
+                    ),
+                )
+
+        return model
+
+
+class TimeSpanQuerySet(models.QuerySet):
+    """
+    A queryset for models that have ``start`` and ``end`` fields
+    """
+
+    def spans(self):
+        """
+        Return ``(start, end)`` rows instead of model instances
+
+        The rows are named tuples, so they can be used anywhere a time span
+        can, e.g. passed to `TimeSpan.merge_sorted_spans`, while skipping
+        the cost of creating model instances.
+        """
+        return self.values_list("start", "end", named=True)
+
+
+class MergedOccurrence(models.Model):
+    """
+    A span of time covered by a schedule's availability occurrences
+
+    These are only stored for availability models that set
+    ``AgendaMeta.merge_occurrences``. They're the schedule's occurrences
+    merged together, so they never overlap or touch, and free time reads
+    can use them as is. They're kept up to date in the same transaction as
+    the occurrences.
+    """
+
+    schedule_type = models.CharField(max_length=100)
+    schedule_id = models.CharField(max_length=64)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    objects = TimeSpanQuerySet.as_manager()
+
+    class Meta:
+        index_together = (("schedule_type", "schedule_id", "start"),)
+
+    def __str__(self):
+        return "{}:{} {}".format(
+            self.schedule_type, self.schedule_id, TimeSpan(self.start, self.end)
+        )
+
+
+class MergedOccurrenceSource(models.Model):
+    """
+    An availability that a merged occurrence came from
+    """
+
+    occurrence = models.ForeignKey(
+        MergedOccurrence, on_delete=models.CASCADE, related_name="sources"
+    )
+    availability_id = models.CharField(max_length=64)
+
+
+class Page(NamedTuple):
+    """
+    A page of results from `TimeSlotQuerySet.page` or `BookingQuerySet.page`
+    """
+
+    items: list
+    #: pass this as ``after`` to get the next page, ``None`` on the last page
+    next_cursor: Optional[Tuple[datetime, int]]
+
+
+def _page_slots(queryset, after, size: int, start, end):
+    """
+    Return a page of time slots, and the cursor for the next one
+    """
+    if start is not None:
+        queryset = queryset.filter(end__gt=start)
+    if end is not None:
+        queryset = queryset.filter(start__lt=end)
+    if after is not None:
+        # written so that the database can seek to the cursor in the index
+        after_start, after_id = after
+        queryset = queryset.filter(start__gte=after_start).exclude(
+            start=after_start, id__lte=after_id
+        )
+    slots = list(queryset.order_by("start", "id")[:size])
+    if len(slots) < size:
+        return slots, None
+    return slots, (slots[-1].start, slots[-1].id)
+
+
+class TimeSlotQuerySet(TimeSpanQuerySet):
+    def page(
+        self,
+        after: Tuple[datetime, int] = None,
+        size: int = 100,
+        start: datetime = None,
+        end: datetime = None,
+        exclude_padding: bool = False,
+    ) -> Page:
+        """
+        Return a page of time slots, ordered by start
+
+        Instead of an offset, this takes the ``(start, id)`` of the last
+        time slot on the previous page, so it doesn't get slower the further
+        along the pages are. It's meant to be used on a schedule's time
+        slots, e.g. ``schedule.time_slots.page(after=cursor)``, which is
+        backed by an index.
+
+        :param start: Only include time slots that end after this
+        :param end: Only include time slots that start before this
+        :param exclude_padding: Leave out the padding time slots
+        """
+        queryset = self
+        if exclude_padding:
+            queryset = queryset.filter(padding_for__isnull=True)
+        return Page(*_page_slots(queryset, after, size, start, end))
+
+
+class BookingQuerySet(models.QuerySet):
+    def page(
+        self,
+        schedule,
+        after: Tuple[datetime, int] = None,
+        size: int = 100,
+        start: datetime = None,
+        end: datetime = None,
+    ) -> Page:
+        """
+        Return a page of a schedule's bookings, ordered by start
+
+        This pages through the bookings' first (non-padding) time slots,
+        like `TimeSlotQuerySet.page`, so the cursors are the ``(start, id)``
+        of time slots. Each booking shows up once, at its first time slot.
+        """
+        ts_cls = schedule.time_slots.model
+        booking_field = ts_cls._meta.get_field(TimeSlotMeta.get_booking_field(ts_cls))
+        earlier = ts_cls.objects.filter(
+            models.Q(start__lt=models.OuterRef("start"))
+            | models.Q(start=models.OuterRef("start"), id__lt=models.OuterRef("id")),
+            padding_for__isnull=True,
+            **{booking_field.attname: models.OuterRef(booking_field.attname)}
+        )
+        slots = (
             schedule.time_slots.filter(
-                busy=True, end__gt=start, start__lt=end
-            ).order_by("-start")
+                padding_for__isnull=True,
+                **{booking_field.name + "__in": self.values("pk")}
+            )
+            .annotate(has_earlier=models.Exists(earlier))
+            .filter(has_earlier=False)
+        )
+        slots, next_cursor = _page_slots(slots, after, size, start, end)
+        ids = [getattr(slot, booking_field.attname) for slot in slots]
+        bookings = self.in_bulk(ids)
+        return Page([bookings[pk] for pk in ids], next_cursor)
+
+    def with_slot_bounds(self):
+        """
+        Annotate each booking with the bounds of its time slots
+
+        The annotations are ``slot_start``, ``slot_end`` and ``slot_count``
+        for the booked time slots, and ``padded_start`` & ``padded_end``,
+        which include their padding. They're all worked out with subqueries,
+        so listing bookings with their times is one query. Bookings without
+        time slots get ``None`` for the times, and a count of 0.
+        """
+        ts_cls = self.model._meta.get_field("time_slots").related_model
+        booking_field = TimeSlotMeta.get_booking_field(ts_cls)
+        padding_field = "padding_for__" + booking_field
+        slots = ts_cls.objects.filter(**{booking_field: models.OuterRef("pk")})
+        padding = ts_cls.objects.filter(**{padding_field: models.OuterRef("pk")})
+
+        def aggregate(queryset, group_by, function, field):
+            return models.Subquery(
+                queryset.order_by()
+                .values(group_by)
+                .annotate(value=function(field))
+                .values("value"),
+                output_field=queryset.model._meta.get_field(field),
+            )
+
+        return self.annotate(
+            slot_start=aggregate(slots, booking_field, models.Min, "start"),
+            slot_end=aggregate(slots, booking_field, models.Max, "end"),
+            slot_count=Coalesce(
+                models.Subquery(
+                    slots.order_by()
+                    .values(booking_field)
+                    .annotate(value=models.Count("pk"))
+                    .values("value"),
+                    output_field=models.IntegerField(),
+                ),
+                0,
+            ),
+            padded_start=Coalesce(
+                aggregate(padding, padding_field, models.Min, "start"),
+                models.F("slot_start"),
+            ),
+            padded_end=Coalesce(
+                aggregate(padding, padding_field, models.Max, "end"),
+                models.F("slot_end"),
+            ),
         )
 
+    def transition(self, new_state: str, state_field: str = "state") -> int:
+        """
+        Move all the bookings to a new state, and update their time slots
+
+        This has the same effect on the time slots as setting the state and
+        saving each booking, but all the time slots are read with one
+        query, and released & reserved with a few bulk statements, in a
+        single transaction. Like ``save``, this doesn't validate anything,
+        and like ``update``, it doesn't call ``save`` or send signals.
+
+        :returns: The number of bookings
+        """
+        model = self.model
+        using = self._db or router.db_for_write(model)
+        with transaction.atomic(using=using):
+            bookings = list(self.using(using).select_for_update())
+            if not bookings:
+                return 0
+            for booking in bookings:
+                setattr(booking, state_field, new_state)
+            diffs = model._get_time_slot_diffs(bookings, using)
+            values = {state_field: new_state}
+            for field in model._meta.concrete_fields:
+                if getattr(field, "auto_now", False):
+                    values[field.name] = django.utils.timezone.now()
+            ids = [booking.pk for booking in bookings]
+            model.objects.using(using).filter(pk__in=ids).update(**values)
+            model._apply_time_slot_diffs(bookings, diffs, using)
+        return len(bookings)
+
+
+def _get_free_time_sources(schedule, start: datetime, end: datetime, using: str):
+    """
+    Return the occurrences & busy time slots that a schedule's free times
+    between start and end are worked out from
+
+    :returns: The occurrences, which are a list of spans if they aren't
+        stored, or a queryset, and a queryset of the busy time slots
+    """
+    busy_q = schedule.time_slots.filter(busy=True, end__gt=start, start__lt=end)
+    if using is None:
+        using = get_read_database(schedule, busy_q.model)
+    if using is not None:
+        busy_q = busy_q.using(using)
+    availabilities = get_availabilities(schedule, end)
+    if availabilities is not None:
+        # occurrences aren't stored, so work them out
+        if using is not None:
+            availabilities = availabilities.using(using)
+        return get_occurrences(availabilities, start, end), busy_q
+    extended = extend_occurrences(schedule, end, using)
+    if extended is not None:
+        using = extended
+        busy_q = busy_q.using(using)
+    aos = _get_occurrence_spans(schedule, start, end)
+    if using is not None:
+        aos = aos.using(using)
+    return aos, busy_q
+
+
+def get_free_times(
+    schedule,
+    start: datetime,
+    end: datetime,
+    in_database: bool = False,
+    using: str = None,
+) -> List[TimeSpan]:
+    """
+    Return the free time spans for a schedule between start and end
+
+    :param in_database: Do the calculation in the database, if it supports
+        window functions and the occurrences are stored. Otherwise, this
+        falls back to doing it in Python.
+    :param using: The database to read from. By default, this is
+        ``AGENDA_READ_DATABASE`` (see `django_agenda.routing`), or the
+        normal routing if that isn't set.
+    """
+    occurrences, busy_q = _get_free_time_sources(schedule, start, end, using)
+    merged = False
+    if isinstance(occurrences, models.QuerySet):
+        if in_database:
+            connection = connections[occurrences.db]
+            if supports_window_functions(connection):
+                spans = get_free_times_sql(occurrences, busy_q, connection)
+                return _subtract_blackouts(schedule, spans, start, end, using)
+        merged = occurrences.model is MergedOccurrence
+        occurrences = occurrences.order_by("start").spans()
+
+    if merged:
+        spans = [TimeSpan(o_start, o_end) for o_start, o_end in occurrences]
+    else:
+        spans = list(TimeSpan.merge_sorted_spans(occurrences))
+
+    if spans:
+        busy_slots = list(busy_q.order_by("-start").spans())
+
         idx = 0
         while busy_slots:
             bs = busy_slots.pop()
@@ -222,17 +667,613 @@ def get_free_times(schedule, start: datetime, end: datetime) -> List[TimeSpan]:
                 span = spans[idx]
                 if bs.end <= span.start:
                     break
+                elif bs.start >= span.end:
+                    idx += 1
                 elif bs.end < span.end:
                     spans[idx] = TimeSpan(bs.end, span.end)
                     if bs.start > span.start:
                         spans.insert(idx, TimeSpan(span.start, bs.start))
                         idx += 1
                     break
-                else:
-                    if bs.start < span.end:
-                        spans[idx] = TimeSpan(span.start, bs.start)
+                elif bs.start > span.start:
+                    # the busy slot covers the end of the span
+                    spans[idx] = TimeSpan(span.start, bs.start)
                     idx += 1
-    return spans
+                else:
+                    # the busy slot covers the whole span
+                    del spans[idx]
+    return _subtract_blackouts(schedule, spans, start, end, using)
+
+
+def iter_free_times(
+    schedule, start: datetime, end: datetime, using: str = None
+) -> Iterator[TimeSpan]:
+    """
+    Yield the free time spans for a schedule between start and end
+
+    This gives the same spans as `get_free_times`, but the stored
+    occurrences and busy time slots are read with database cursors and
+    merged as they come in, so long ranges never have to be in memory at
+    once. It goes well with the streaming functions in
+    `django_agenda.serializers`.
+    """
+    occurrences, busy_q = _get_free_time_sources(schedule, start, end, using)
+    if isinstance(occurrences, models.QuerySet):
+        occurrences = occurrences.order_by("start").spans().iterator()
+    busy_slots = busy_q.order_by("start").spans().iterator()
+    spans = TimeSpan.subtract_sorted_spans(
+        TimeSpan.merge_sorted_spans(occurrences),
+        TimeSpan.merge_sorted_spans(busy_slots),
+    )
+    blackouts = get_blackouts(schedule, start, end, using)
+    yield from TimeSpan.subtract_sorted_spans(spans, blackouts)
+
+
+def _subtract_blackouts(
+    schedule, spans: List[TimeSpan], start, end, using: str = None
+) -> list:
+    blackouts = get_blackouts(schedule, start, end, using)
+    if not blackouts:
+        return spans
+    return list(TimeSpan.subtract_sorted_spans(spans, blackouts))
+
+
+def _get_version_key(schedule_model, schedule_id) -> dict:
+    return {
+        "schedule_type": get_schedule_model(schedule_model)._meta.label_lower,
+        "schedule_id": str(schedule_id),
+    }
+
+
+def bump_agenda_version(schedule_model, schedule_id, using: str = None):
+    """
+    Increment a schedule's version
+
+    This should be run in the transaction that changed the schedule.
+    """
+    key = _get_version_key(schedule_model, schedule_id)
+    manager = ScheduleVersion.objects.db_manager(using)
+    modified_at = django.utils.timezone.now()
+    increment = {"version": models.F("version") + 1, "modified_at": modified_at}
+    if manager.filter(**key).update(**increment):
+        return
+    try:
+        with transaction.atomic(using=manager.db):
+            manager.create(version=1, modified_at=modified_at, **key)
+    except IntegrityError:
+        # somebody else created it first
+        manager.filter(**key).update(**increment)
+
+
+def _change_feed_enabled() -> bool:
+    return getattr(settings, "AGENDA_CHANGE_FEED", False)
+
+
+def _schedule_changed(
+    schedule_model,
+    schedule_id,
+    using: str = None,
+    materialized_until=None,
+    kind: str = None,
+    spans: Iterable[AbstractTimeSpan] = (),
+):
+    """
+    Bookkeeping for a change to a schedule
+
+    :param kind: The `AgendaChange` kind to record spans as
+    :param spans: The times that changed, for the change feed
+    """
+    bump_agenda_version(schedule_model, schedule_id, using)
+    if kind is not None and _change_feed_enabled():
+        key = _get_version_key(schedule_model, schedule_id)
+        AgendaChange.objects.using(using).bulk_create(
+            AgendaChange(start=span.start, end=span.end, kind=kind, **key)
+            for span in TimeSpan.merge_spans(spans)
+        )
+    if materialized_until is not None:
+        # some occurrences might only go this far now
+        ScheduleVersion.objects.using(using).filter(
+            models.Q(materialized_until__isnull=True)
+            | models.Q(materialized_until__gt=materialized_until),
+            **_get_version_key(schedule_model, schedule_id)
+        ).update(materialized_until=materialized_until)
+    mark_schedule_written(schedule_model, schedule_id, using)
+
+
+def _merges_occurrences(model) -> bool:
+    """
+    Return True if merged occurrences are stored for an availability model
+    """
+    meta = getattr(model, "AgendaMeta", None)
+    return is_materialized(model) and getattr(meta, "merge_occurrences", False)
+
+
+def _get_occurrence_spans(schedule, start: datetime, end: datetime):
+    """
+    Return a queryset of the schedule's occurrences that overlap start-end
+
+    For schedules with merged occurrences, this is the merged ones.
+    """
+    if _merges_occurrences(schedule.availabilities.model):
+        return MergedOccurrence.objects.filter(
+            end__gt=start,
+            start__lt=end,
+            **_get_version_key(type(schedule), schedule.pk)
+        )
+    return schedule.availability_occurrences.filter(end__gt=start, start__lt=end)
+
+
+def _merge_occurrences(
+    availability_model, schedule_id, spans: Iterable[AbstractTimeSpan], using: str
+):
+    """
+    Update the merged occurrences of a schedule, where its occurrences
+    changed in spans
+
+    This should be run in the transaction that changed the occurrences,
+    after the schedule's version has been bumped, which locks the
+    schedule's row.
+    """
+    spans = list(spans)
+    if not spans or not _merges_occurrences(availability_model):
+        return
+    ao_cls = availability_model._meta.get_field("occurrences").related_model
+    ao_schedule = ao_cls._meta.get_field(Meta.get_schedule_field(ao_cls))
+    ao_availability = ao_cls._meta.get_field(
+        OccurrenceMeta.get_availability_field(ao_cls)
+    )
+    merged_q = MergedOccurrence.objects.using(using).filter(
+        **_get_version_key(ao_schedule.related_model, schedule_id)
+    )
+    occurrence_q = ao_cls.objects.using(using).filter(
+        **{ao_schedule.attname: schedule_id}
+    )
+
+    # spans that touch the range get merged with what's in it, and can
+    # stretch it, so widen it until nothing else touches it
+    lo = min(span.start for span in spans)
+    hi = max(span.end for span in spans)
+    while True:
+        bounds = [(lo, hi)]
+        for queryset in (merged_q, occurrence_q):
+            result = queryset.filter(end__gte=lo, start__lte=hi).aggregate(
+                lo=models.Min("start"), hi=models.Max("end")
+            )
+            bounds.append((result["lo"], result["hi"]))
+        new_lo = min(b_lo for b_lo, _b_hi in bounds if b_lo is not None)
+        new_hi = max(b_hi for _b_lo, b_hi in bounds if b_hi is not None)
+        if (new_lo, new_hi) == (lo, hi):
+            break
+        lo, hi = new_lo, new_hi
+
+    rows = (
+        occurrence_q.filter(end__gte=lo, start__lte=hi)
+        .order_by("start")
+        .values_list(ao_availability.attname, "start", "end")
+    )
+    merged = []
+    for availability_id, start, end in rows.iterator():
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+            merged[-1][2].add(str(availability_id))
+        else:
+            merged.append([start, end, {str(availability_id)}])
+
+    old = merged_q.filter(end__gte=lo, start__lte=hi)
+    MergedOccurrenceSource.objects.using(using).filter(
+        occurrence__in=old.values("pk")
+    )._raw_delete(using)
+    old._raw_delete(using)
+    key = _get_version_key(ao_schedule.related_model, schedule_id)
+    objs = _bulk_create(
+        MergedOccurrence,
+        [MergedOccurrence(start=start, end=end, **key) for start, end, _ids in merged],
+        using=using,
+    )
+    MergedOccurrenceSource.objects.using(using).bulk_create(
+        MergedOccurrenceSource(occurrence=obj, availability_id=availability_id)
+        for obj, (_start, _end, ids) in zip(objs, merged)
+        for availability_id in sorted(ids)
+    )
+
+
+def _get_materialized_until(
+    schedule_model, schedule_id, using: str = None
+) -> Optional[datetime]:
+    queryset = ScheduleVersion.objects.filter(
+        **_get_version_key(schedule_model, schedule_id)
+    )
+    if using is not None:
+        queryset = queryset.using(using)
+    return queryset.values_list("materialized_until", flat=True).first()
+
+
+def extend_occurrences(schedule, end: datetime, using: str = None) -> Optional[str]:
+    """
+    Make sure a schedule's occurrences are stored until at least end
+
+    Schedules start being tracked the first time their occurrences get
+    generated with `AbstractAvailability.recreate_occurrences` (or
+    ``bulk_import``), which also move the tracked end back if they generate
+    less than what's there. After that, reading past the stored occurrences
+    generates the missing range, at least `EXTENSION_STEP` at a time. The
+    schedule's row is locked while that happens, so it only happens once.
+
+    :param using: The database that the caller reads from
+    :returns: The database that the occurrences were generated on, which
+        should be read from from now on, or ``None`` if nothing was missing
+    """
+    availabilities = getattr(schedule, "availabilities", None)
+    if availabilities is None or not is_materialized(availabilities.model):
+        return None
+    schedule_model = type(schedule)
+    horizon = _get_materialized_until(schedule_model, schedule.pk, using)
+    if horizon is None or horizon >= end:
+        return None
+    write_db = get_schedule_database(availabilities.model, schedule_model, schedule.pk)
+    with transaction.atomic(using=write_db):
+        row = (
+            ScheduleVersion.objects.using(write_db)
+            .select_for_update()
+            .get(**_get_version_key(schedule_model, schedule.pk))
+        )
+        horizon = row.materialized_until
+        if horizon >= end:
+            # somebody else got here first
+            return write_db
+        new_end = max(end, horizon + EXTENSION_STEP)
+        changed = []
+        for availability in availabilities.using(write_db):
+            zone = availability.get_timezone()
+            existing = availability.occurrences.using(write_db).filter(
+                start__gte=horizon, start__lte=new_end
+            )
+            span = TimeSpan(horizon.astimezone(zone), new_end.astimezone(zone))
+            changed += availability._sync_occurrences(span, existing, write_db)
+        _merge_occurrences(availabilities.model, schedule.pk, changed, write_db)
+        row.materialized_until = new_end
+        row.save(update_fields=["materialized_until"])
+        mark_schedule_written(schedule_model, schedule.pk, write_db)
+    return write_db
+
+
+def merge_all_occurrences(availability_model, using: str = None) -> int:
+    """
+    Store the merged occurrences of every schedule with occurrences
+
+    Merged occurrences are only kept up to date for the occurrences that
+    change while ``merge_occurrences`` is set, so run this once after
+    setting it on a model that already has occurrences. Until then free
+    times & bookings are read from the (empty) merged occurrences. It can
+    be run again, and replaces what's there. Each schedule gets merged in
+    its own transaction.
+
+    :param using: The database to merge on. With a shard resolver, run it
+        on each shard.
+    :returns: The number of schedules that were merged
+    """
+    if not _merges_occurrences(availability_model):
+        raise RuntimeError("Model must specify AgendaMeta.merge_occurrences")
+    ao_cls = availability_model._meta.get_field("occurrences").related_model
+    ao_schedule = ao_cls._meta.get_field(Meta.get_schedule_field(ao_cls))
+    schedule_model = ao_schedule.related_model
+    using = using or router.db_for_write(ao_cls)
+    ranges = (
+        ao_cls.objects.using(using)
+        .order_by()
+        .values_list(ao_schedule.attname)
+        .annotate(start=models.Min("start"), end=models.Max("end"))
+    )
+    count = 0
+    for schedule_id, start, end in ranges:
+        with transaction.atomic(using=using):
+            _schedule_changed(schedule_model, schedule_id, using)
+            _merge_occurrences(
+                availability_model, schedule_id, [TimeSpan(start, end)], using
+            )
+        count += 1
+    return count
+
+
+def get_agenda_version(schedule, using: str = None) -> int:
+    """
+    Return a number that changes whenever the schedule's free times might
+
+    This is a single indexed lookup, so it's cheap enough to check on every
+    request.
+
+    Changes to blackouts that apply to every schedule bump a version that's
+    shared by all the schedules of a type, which is included.
+
+    :param using: The database to read from, see `get_free_times`
+    """
+    queryset = _get_version_queryset(schedule, using)
+    return queryset.aggregate(version=models.Sum("version"))["version"] or 0
+
+
+def get_agenda_modified(schedule, using: str = None) -> Optional[datetime]:
+    """
+    Return when the schedule's version was last bumped, or ``None`` if it
+    never was
+
+    :param using: The database to read from, see `get_free_times`
+    """
+    queryset = _get_version_queryset(schedule, using)
+    return queryset.aggregate(modified_at=models.Max("modified_at"))["modified_at"]
+
+
+def _get_version_queryset(schedule, using: str = None):
+    if using is None:
+        time_slots = getattr(schedule, "time_slots", None)
+        using = get_read_database(schedule, getattr(time_slots, "model", None))
+    queryset = ScheduleVersion.objects.filter(
+        models.Q(**_get_version_key(type(schedule), schedule.pk))
+        | models.Q(**_get_version_key(type(schedule), AgendaChange.ALL_SCHEDULES))
+    )
+    if using is not None:
+        queryset = queryset.using(using)
+    return queryset
+
+
+def get_agenda_etag(schedule, using: str = None) -> str:
+    """
+    Return an ETag for the schedule's agenda, see `get_agenda_version`
+
+    This can be passed straight to
+    ``django.utils.cache.get_conditional_response``.
+    """
+    return '"agenda-{}"'.format(get_agenda_version(schedule, using))
+
+
+def _align_to_step(value: datetime, step: timedelta, zone) -> datetime:
+    """
+    Return the first time on or after value that's on the step grid
+
+    The grid starts at midnight (local time) of value's day.
+    """
+    local = value.astimezone(zone).replace(tzinfo=None)
+    midnight = datetime.combine(local.date(), datetime.min.time())
+    steps = -((midnight - local) // step)
+    result = zone.normalize(zone.localize(midnight + steps * step))
+    if result < value:
+        # this can happen around daylight savings changes
+        result += step
+    return result
+
+
+def _get_grid_spans(schedule, start, end, padding: timedelta, using: str):
+    """
+    Return the free spans, and the merged busy spans, for a slot search
+    """
+    if using is None:
+        using = get_read_database(schedule, schedule.time_slots.model)
+    free_spans = get_free_times(schedule, start, end, using=using)
+    busy_q = schedule.time_slots.filter(
+        busy=True, end__gt=start - padding, start__lt=end + padding
+    ).order_by("start")
+    if using is not None:
+        busy_q = busy_q.using(using)
+    return free_spans, list(TimeSpan.merge_sorted_spans(busy_q.spans()))
+
+
+def _iter_slot_grid(
+    free_spans: List[TimeSpan],
+    busy_spans: List[TimeSpan],
+    start: datetime,
+    end: datetime,
+    duration: timedelta,
+    step: timedelta,
+    padding: timedelta,
+    zone,
+) -> Iterator[Tuple[TimeSpan, datetime]]:
+    """
+    Yield each valid start time on the grid, with the free span it's in
+    """
+    busy_idx = 0
+    for span in free_spans:
+        candidate = _align_to_step(max(span.start, start), step, zone)
+        while candidate < end and candidate + duration <= span.end:
+            padded_start = candidate - padding
+            padded_end = candidate + duration + padding
+            while (
+                busy_idx < len(busy_spans) and busy_spans[busy_idx].end <= padded_start
+            ):
+                busy_idx += 1
+            if not (
+                busy_idx < len(busy_spans) and busy_spans[busy_idx].start < padded_end
+            ):
+                yield span, candidate
+            candidate = _align_to_step(candidate + step, step, zone)
+
+
+def get_slot_grid(
+    schedule,
+    start: datetime,
+    end: datetime,
+    duration: timedelta,
+    step: timedelta,
+    padding: timedelta = timedelta(0),
+    timezone=None,
+    packed: bool = False,
+    using: str = None,
+):
+    """
+    Return all the times between start and end that a booking could start
+
+    Start times are aligned to a grid of ``step`` starting at midnight in
+    the given time zone (the current time zone, by default). A start time
+    is valid if the booking's whole duration is free, and its padding
+    doesn't overlap anything busy.
+
+    :param packed: Return a dictionary mapping each local date to a
+        packed bit array (see `pack_slot_grid`) instead of a list of times.
+    :param using: The database to read from, see `get_free_times`
+    """
+    zone = timezone or django.utils.timezone.get_current_timezone()
+    free_spans, busy_spans = _get_grid_spans(schedule, start, end, padding, using)
+    result = [
+        candidate
+        for _span, candidate in _iter_slot_grid(
+            free_spans, busy_spans, start, end, duration, step, padding, zone
+        )
+    ]
+    if packed:
+        return pack_slot_grid(result, step, zone)
+    return result
+
+
+class SlotSuggestion(NamedTuple):
+    """
+    A start time from `suggest_slots`
+    """
+
+    start: datetime
+    #: the free time on either side that's too short to be booked
+    waste: timedelta
+    #: the free time left before the booking & its padding
+    gap_before: timedelta
+    #: the free time left after the booking & its padding
+    gap_after: timedelta
+
+
+def suggest_slots(
+    schedule,
+    start: datetime,
+    end: datetime,
+    duration: timedelta,
+    step: timedelta,
+    padding: timedelta = timedelta(0),
+    min_gap: timedelta = None,
+    timezone=None,
+    limit: int = None,
+    using: str = None,
+) -> List[SlotSuggestion]:
+    """
+    Return the times between start and end that a booking could start, the
+    ones that fit best first
+
+    The times are the same ones as `get_slot_grid` returns. Each one is
+    scored by the free time it would leave on either side, in the free span
+    it's in. Gaps that are shorter than min_gap count as wasted, so the
+    best times are ones that fill a span exactly, or leave room for more
+    bookings. Times with the same waste are sorted by start.
+
+    :param min_gap: The shortest gap that can still be booked. By default,
+        it's long enough for another booking like this one, with padding.
+    :param limit: Only return this many suggestions
+    """
+    zone = timezone or django.utils.timezone.get_current_timezone()
+    if min_gap is None:
+        min_gap = duration + 2 * padding
+    free_spans, busy_spans = _get_grid_spans(schedule, start, end, padding, using)
+    zero = timedelta(0)
+    suggestions = []
+    for span, candidate in _iter_slot_grid(
+        free_spans, busy_spans, start, end, duration, step, padding, zone
+    ):
+        before = max(candidate - padding - span.start, zero)
+        after = max(span.end - (candidate + duration + padding), zero)
+        waste = zero
+        if before < min_gap:
+            waste += before
+        if after < min_gap:
+            waste += after
+        suggestions.append(SlotSuggestion(candidate, waste, before, after))
+    if limit is not None:
+        return heapq.nsmallest(limit, suggestions, key=_suggestion_key)
+    suggestions.sort(key=_suggestion_key)
+    return suggestions
+
+
+def _suggestion_key(suggestion: SlotSuggestion):
+    return suggestion.waste, suggestion.start
+
+
+def pack_slot_grid(starts: List[datetime], step: timedelta, zone) -> dict:
+    """
+    Pack start times into a bit array per local day
+
+    Bit ``n`` (counting from the most significant bit of the first byte)
+    is set if ``n * step`` after midnight is a valid start time.
+    """
+    slots_per_day = -(-timedelta(days=1) // step)
+    result = {}
+    for value in starts:
+        local = value.astimezone(zone).replace(tzinfo=None)
+        day = local.date()
+        bits = result.get(day)
+        if bits is None:
+            bits = result[day] = bytearray(-(-slots_per_day // 8))
+        index = (local - datetime.combine(day, datetime.min.time())) // step
+        bits[index // 8] |= 0x80 >> (index % 8)
+    return {day: bytes(bits) for day, bits in result.items()}
+
+
+def _bulk_create(model, objs: list, batch_size: int = None, using=None) -> list:
+    """
+    Bulk create objects, making sure they get their primary keys set
+
+    On databases that can't return the primary keys of a bulk insert, the
+    rows are inserted one at a time, like ``save`` would, but without
+    sending any signals.
+    """
+    if using is None:
+        using = router.db_for_write(model)
+    manager = model.objects.using(using)
+    features = connections[using].features
+    if getattr(features, "can_return_ids_from_bulk_insert", False) or getattr(
+        features, "can_return_rows_from_bulk_insert", False
+    ):
+        return manager.bulk_create(objs, batch_size)
+    meta = model._meta
+    fields = [field for field in meta.concrete_fields if field is not meta.auto_field]
+    with transaction.atomic(using=using):
+        for obj in objs:
+            obj.pk = manager._insert([obj], fields=fields, return_id=True)
+            obj._state.adding = False
+            obj._state.db = using
+    return objs
+
+
+def _release_time_slots(slots, using: str) -> dict:
+    """
+    Delete time slots and their padding, with one statement each
+
+    The slots aren't collected by Django first, so no signals get sent, and
+    nothing else should refer to them.
+
+    :returns: The released spans, by schedule id, if the change feed is on
+    """
+    ts_cls = slots.model
+    padding = ts_cls.objects.using(using).filter(padding_for__in=slots.values("pk"))
+    released = defaultdict(list)
+    if _change_feed_enabled():
+        schedule_field = ts_cls._meta.get_field(Meta.get_schedule_field(ts_cls))
+        rows = (slots | padding).values_list(
+            schedule_field.attname, "start", "end", named=True
+        )
+        for row in rows:
+            released[row[0]].append(row)
+    padding._raw_delete(using)
+    slots._raw_delete(using)
+    return released
+
+
+class BulkImportResult(NamedTuple):
+    """
+    The outcome of `AbstractAvailability.bulk_import`
+    """
+
+    availabilities: list
+    occurrence_count: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        rows = len(self.availabilities) + self.occurrence_count
+        if not self.seconds:
+            return float(rows)
+        return rows / self.seconds
 
 
 class AbstractSchedule(models.Model):
@@ -246,8 +1287,20 @@ class AbstractSchedule(models.Model):
     class Meta:
         abstract = True
 
-    def get_free_times(self, start: datetime, end: datetime) -> List[TimeSpan]:
-        return get_free_times(self, start, end)
+    def get_free_times(
+        self,
+        start: datetime,
+        end: datetime,
+        in_database: bool = False,
+        using: str = None,
+    ) -> List[TimeSpan]:
+        return get_free_times(self, start, end, in_database, using)
+
+    def get_slot_grid(self, start: datetime, end: datetime, *args, **kwargs):
+        return get_slot_grid(self, start, end, *args, **kwargs)
+
+    def suggest_slots(self, start: datetime, end: datetime, *args, **kwargs):
+        return suggest_slots(self, start, end, *args, **kwargs)
 
 
 # the actual base classes
@@ -272,6 +1325,84 @@ class AbstractAvailability(models.Model, metaclass=Meta):
     updated_at = models.DateTimeField(auto_now=True)
     timezone = TimeZoneField()
 
+    # fields that affect when occurrences happen, besides the recurrence
+    TIMING_FIELDS = ("start_date", "start_time", "end_time", "timezone")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        fields = cls.TIMING_FIELDS + ("recurrence",)
+        if all(name in field_names for name in fields):
+            instance._generated_state = instance._get_generation_state()
+        return instance
+
+    def _get_generation_state(self) -> dict:
+        """
+        Return the values that the occurrences are generated from
+
+        The values are all strings, so the state can be handed to a task
+        queue (see `django_agenda.signals`).
+        """
+        state = {name: str(getattr(self, name)) for name in self.TIMING_FIELDS}
+        state["timezone"] = str(self.get_timezone())
+        state["recurrence"] = recurrence.serialize(self.recurrence)
+        return state
+
+    def _get_changed_ranges(self) -> Optional[List[Tuple[datetime, datetime]]]:
+        """
+        Figure out which parts of the occurrences need to be regenerated
+
+        This compares the current values with the ones that the occurrences
+        were last generated from (or loaded from the database with). If the
+        only difference is in the exclusion & inclusion dates, or the
+        ``UNTIL`` of a rule, this returns a list of (naive, local) ranges
+        that are affected. An end of ``None`` means there's no end.
+
+        :returns: A list of ranges, or ``None`` if everything needs to be
+            regenerated
+        """
+        old_state = getattr(self, "_generated_state", None)
+        if old_state is None:
+            return None
+        new_state = self._get_generation_state()
+        if old_state == new_state:
+            return None
+        if any(old_state[name] != new_state[name] for name in self.TIMING_FIELDS):
+            return None
+        include_dtstart = self._meta.get_field("recurrence").include_dtstart
+        old = recurrence.deserialize(old_state["recurrence"], include_dtstart)
+        new = recurrence.deserialize(new_state["recurrence"], include_dtstart)
+        if (
+            old.dtstart != new.dtstart
+            or old.dtend != new.dtend
+            or old.exrules != new.exrules
+            or len(old.rrules) != len(new.rrules)
+        ):
+            return None
+
+        dt_start = datetime.combine(self.start_date, self.start_time)
+
+        def naive(value):
+            return normalize_offset_awareness(value, dt_start)
+
+        ranges = []
+        for old_rule, new_rule in zip(old.rrules, new.rrules):
+            if old_rule == new_rule:
+                continue
+            # besides the until, the rules have to be the same
+            check_rule = copy.copy(old_rule)
+            check_rule.until = new_rule.until
+            if check_rule != new_rule or old_rule.count or new_rule.count:
+                return None
+            untils = [naive(r.until) for r in (old_rule, new_rule) if r.until]
+            ends = None if len(untils) < 2 else max(untils)
+            ranges.append((min(untils), ends))
+        changed_dates = set(old.exdates) ^ set(new.exdates)
+        changed_dates |= set(old.rdates) ^ set(new.rdates)
+        for changed in changed_dates:
+            ranges.append((naive(changed), naive(changed)))
+        return ranges
+
     # regular properties
     @property
     def start_localized(self) -> datetime:
@@ -289,6 +1420,14 @@ class AbstractAvailability(models.Model, metaclass=Meta):
             date(1, 1, 1), self.start_time
         )
 
+    def _get_write_database(self) -> str:
+        """
+        Return the database that this availability's schedule lives on
+        """
+        return get_schedule_database(
+            type(self), *Meta.get_schedule_key(self), instance=self
+        )
+
     def get_timezone(self):
         # TODO: this is hacky
         if hasattr(self.timezone, "localize"):
@@ -304,10 +1443,12 @@ class AbstractAvailability(models.Model, metaclass=Meta):
         dt_start = datetime.combine(self.start_date, self.start_time)
         naive_start = django.utils.timezone.make_naive(span.start, span.start.tzinfo)
         naive_end = django.utils.timezone.make_naive(span.end, span.start.tzinfo)
-        starts = self.recurrence.between(
-            naive_start, naive_end, inc=True, dtstart=dt_start
-        )
-        for start_time in starts:
+        # iterate lazily, rather than using ``between``, which builds a list
+        # of every start
+        rruleset = self.recurrence.to_dateutil_rruleset(dtstart=dt_start)
+        for start_time in rruleset.xafter(naive_start, inc=True):
+            if start_time > naive_end:
+                break
             try:
                 start_time = django.utils.timezone.make_aware(start_time, zone)
             except (pytz.AmbiguousTimeError, pytz.NonExistentTimeError):
@@ -330,33 +1471,236 @@ class AbstractAvailability(models.Model, metaclass=Meta):
             )
         return result
 
+    def delete(self, using=None, keep_parents=False):
+        using = using or self._get_write_database()
+        changed = []
+        with transaction.atomic(using=using):
+            if not is_materialized(type(self)):
+                # without stored occurrences, anything from the start on
+                # might have changed
+                changed.append(TimeSpan(self.start_localized, FAR_FUTURE))
+            elif _change_feed_enabled() or _merges_occurrences(type(self)):
+                changed += self.occurrences.using(using).spans()
+            schedule_key = Meta.get_schedule_key(self)
+            result = super().delete(using, keep_parents)
+            _schedule_changed(
+                *schedule_key,
+                using=using,
+                kind=AgendaChange.AVAILABILITY,
+                spans=changed
+            )
+            _merge_occurrences(type(self), schedule_key[1], changed, using)
+        return result
+
+    @classmethod
+    def bulk_import(
+        cls,
+        schedule,
+        items: Iterable[dict],
+        start: datetime,
+        end: datetime,
+        batch_size: int = 500,
+    ) -> BulkImportResult:
+        """
+        Create a lot of availabilities for a schedule at once
+
+        The availabilities are created with ``bulk_create``, so no
+        ``post_save`` signals are sent, and no occurrences get generated
+        one by one. Instead, the occurrences between start and end are
+        generated for the whole import afterwards, in batches.
+
+        :param items: Field values for each availability, as produced by
+            `django_agenda.ical.parse_ics`, for example
+        """
+        began = perf_counter()
+        schedule_field = Meta.get_schedule_field(cls)
+        objs = [cls(**dict(item, **{schedule_field: schedule})) for item in items]
+        using = get_schedule_database(cls, type(schedule), schedule.pk)
+        with transaction.atomic(using=using):
+            objs = _bulk_create(cls, objs, batch_size, using)
+            count = cls._bulk_create_occurrences(objs, start, end, batch_size, using)
+            _schedule_changed(
+                type(schedule),
+                schedule.pk,
+                using,
+                end,
+                kind=AgendaChange.AVAILABILITY,
+                spans=[TimeSpan(start, end)] if objs else (),
+            )
+            if objs:
+                _merge_occurrences(cls, schedule.pk, [TimeSpan(start, end)], using)
+        return BulkImportResult(objs, count, perf_counter() - began)
+
+    @classmethod
+    def _bulk_create_occurrences(
+        cls,
+        availabilities: List["AbstractAvailability"],
+        start: datetime,
+        end: datetime,
+        batch_size: int,
+        using: str,
+    ) -> int:
+        """
+        Generate occurrences for availabilities that don't have any yet
+
+        Unlike `recreate_occurrences`, this doesn't look at the existing
+        occurrences at all, it just inserts new ones. It also leaves the
+        schedule's bookkeeping (versions, change feed, merged occurrences,
+        horizon) to the caller, `bulk_import`.
+
+        :returns: The number of occurrences created
+        """
+        if not availabilities or not is_materialized(cls):
+            return 0
+        span = TimeSpan(start, end)
+        ao_cls = availabilities[0].occurrences.model
+        ao_manager = ao_cls.objects.db_manager(using)
+        count = 0
+        batch = []
+        for availability in availabilities:
+            params = Meta.get_schedule_params(ao_cls, availability)
+            for r_start, r_end in availability.get_recurrences(span):
+                batch.append(
+                    ao_cls(
+                        availability=availability, start=r_start, end=r_end, **params
+                    )
+                )
+                if len(batch) >= batch_size:
+                    ao_manager.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            availability._generated_state = availability._get_generation_state()
+        ao_manager.bulk_create(batch)
+        return count + len(batch)
+
     def recreate_occurrences(self, start: datetime, end: datetime):
         """
         Recreate all availability occurrences between start and end
 
         This is intended to be used when an availability get saved.
+
+        If the only thing that changed since the occurrences were last
+        generated is an exclusion/inclusion date, or the end of a rule, only
+        the affected dates are regenerated, along with any dates past the
+        schedule's generated horizon. Otherwise, every occurrence of this
+        availability gets checked.
+
+        If ``AgendaMeta.materialize_occurrences`` is false, nothing is stored
+        (see `django_agenda.virtual`).
         """
+        using = self._get_write_database()
+        schedule_key = Meta.get_schedule_key(self)
+        kind = AgendaChange.AVAILABILITY
         span = TimeSpan(start, end)
-        ao_cls = self.occurrences.model
-        params = {Meta.get_schedule_field(ao_cls): Meta.get_schedule(self)}
-        # get all the original ones
-        with transaction.atomic():
-            all_slots = self.occurrences.all()
+        if not is_materialized(type(self)):
+            _schedule_changed(*schedule_key, using=using, kind=kind, spans=[span])
+            self._generated_state = self._get_generation_state()
+            return
+        ranges = self._get_changed_ranges()
+        horizon = None
+        if ranges is not None:
+            # the rest only got generated as far as the schedule's horizon,
+            # and we can't tell how far that was without one
+            horizon = _get_materialized_until(*schedule_key, using=using)
+            if horizon is None:
+                ranges = None
+        occurrences = self.occurrences.using(using)
+        changed = []
+        with transaction.atomic(using=using):
+            if ranges is None:
+                changed += self._sync_occurrences(span, occurrences.all(), using)
+            else:
+                zone = self.get_timezone()
+                if horizon < end:
+                    t_start = max(start, horizon)
+                    t_span = TimeSpan(t_start.astimezone(zone), end.astimezone(zone))
+                    existing = occurrences.filter(start__gte=t_start, start__lte=end)
+                    changed += self._sync_occurrences(t_span, existing, using)
+                for range_start, range_end in ranges:
+                    r_start = max(start, self.timezone_localize(range_start))
+                    r_end = end
+                    if range_end is not None:
+                        r_end = min(end, self.timezone_localize(range_end))
+                    if r_start > r_end:
+                        continue
+                    r_span = TimeSpan(r_start.astimezone(zone), r_end.astimezone(zone))
+                    existing = occurrences.filter(start__gte=r_start, start__lte=r_end)
+                    changed += self._sync_occurrences(r_span, existing, using)
+                # like a full rebuild, drop anything outside of start-end
+                outside = occurrences.exclude(start__gte=start, start__lte=end)
+                changed += TimeSpan.merge_spans(outside.spans())
+                outside.delete()
+            _schedule_changed(
+                *schedule_key,
+                using=using,
+                materialized_until=end,
+                kind=kind,
+                spans=changed
+            )
+            _merge_occurrences(type(self), schedule_key[1], changed, using)
+        self._generated_state = self._get_generation_state()
+
+    def _sync_occurrences(self, span: TimeSpan, existing, using: str) -> list:
+        """
+        Make the occurrences in existing match the recurrences in span
+
+        The span is worked through in chunks of `GENERATION_CHUNK`, so only
+        one chunk's recurrences & occurrences are in memory at a time, and
+        each chunk's inserts and deletes are sent before the next one is
+        read. This should be run inside a transaction.
+
+        :param existing: A queryset of the occurrences to sync. The first
+            & last chunks also get any that are before or after the span.
+        :returns: The spans of the occurrences that were added or removed.
+            Chunks with lots of changes get a single span instead.
+        """
+        ao_manager = self.occurrences.model.objects.db_manager(using)
+        ao_cls = ao_manager.model
+        params = Meta.get_schedule_params(ao_cls, self)
+        recurrences = self.get_recurrences(span)
+        upcoming = next(recurrences, None)
+        chunk_start = None
+        changed = []
+        while chunk_start is None or chunk_start < span.end:
+            chunk_end = (chunk_start or span.start) + GENERATION_CHUNK
+            chunk_q = existing
+            if chunk_start is not None:
+                chunk_q = chunk_q.filter(start__gte=chunk_start)
+            if chunk_end < span.end:
+                chunk_q = chunk_q.filter(start__lt=chunk_end)
             # note, we can have multiple occurrences at the same start time
             occurrence_dict = {}
-            for occurrence in all_slots:
+            for occurrence in chunk_q.values_list("id", "start", "end", named=True):
                 occurrence_dict[(occurrence.start, occurrence.end)] = occurrence
-            for r_start, r_end in self.get_recurrences(span):
+            chunk_changed = []
+            new_occurrences = []
+            while upcoming is not None and (
+                chunk_end >= span.end or upcoming[0] < chunk_end
+            ):
+                r_start, r_end = upcoming
                 if (r_start, r_end) in occurrence_dict:
                     # yay we matched our occurrence, pop it
                     del occurrence_dict[(r_start, r_end)]
                 else:
-                    ao_cls.objects.create(
-                        availability=self, start=r_start, end=r_end, **params
+                    new_occurrences.append(
+                        ao_cls(availability=self, start=r_start, end=r_end, **params)
                     )
+                    chunk_changed.append(TimeSpan(r_start, r_end))
+                upcoming = next(recurrences, None)
+            ao_manager.bulk_create(new_occurrences)
             # remaining occurrence_dict items need to die
-            old_ids = (oc.id for oc in occurrence_dict.values())
-            ao_cls.objects.filter(id__in=old_ids).delete()
+            old_ids = [oc.id for oc in occurrence_dict.values()]
+            if old_ids:
+                ao_manager.filter(id__in=old_ids).delete()
+            chunk_changed += occurrence_dict.values()
+            chunk_changed = TimeSpan.merge_spans(chunk_changed)
+            if len(chunk_changed) > MAX_CHUNK_CHANGES:
+                chunk_changed = [
+                    TimeSpan(chunk_changed[0].start, chunk_changed[-1].end)
+                ]
+            changed += chunk_changed
+            chunk_start = chunk_end
+        return changed
 
 
 class AbstractAvailabilityOccurrence(models.Model, metaclass=OccurrenceMeta):
@@ -376,7 +1720,7 @@ class AbstractAvailabilityOccurrence(models.Model, metaclass=OccurrenceMeta):
         verbose_name_plural = _("availability occurrences")
         abstract = True
 
-    objects = models.Manager()
+    objects = TimeSpanQuerySet.as_manager()
 
     start = models.DateTimeField(db_index=True)
     end = models.DateTimeField(db_index=True)
@@ -396,7 +1740,7 @@ class AbstractTimeSlot(models.Model, AbstractTimeSpan, metaclass=TimeSlotMeta):
         verbose_name_plural = "time slots"
         abstract = True
 
-    objects = models.Manager()
+    objects = TimeSlotQuerySet.as_manager()
 
     start = models.DateTimeField(db_index=True)  # type: datetime
     end = models.DateTimeField(db_index=True)  # type: datetime
@@ -418,6 +1762,8 @@ class AbstractBooking(models.Model, metaclass=Meta):
     class Meta:
         abstract = True
 
+    objects = BookingQuerySet.as_manager()
+
     busy_message = _("Requested time {start}–{end} is busy")
     un_free_message = _("Requested time {start}–{end} is not available")
 
@@ -478,6 +1824,117 @@ class AbstractBooking(models.Model, metaclass=Meta):
             return self._book_unscheduled()
         return False
 
+    def suggest_times(
+        self,
+        start: datetime,
+        end: datetime,
+        duration: timedelta,
+        step: timedelta,
+        **kwargs
+    ) -> List[SlotSuggestion]:
+        """
+        Return the times this booking could start in its schedule, the ones
+        that fit best first
+
+        This is `suggest_slots`, with the booking's padding.
+        """
+        return suggest_slots(
+            Meta.get_schedule(self),
+            start,
+            end,
+            duration,
+            step,
+            padding=self.get_padding(),
+            **kwargs
+        )
+
+    def _get_write_database(self) -> str:
+        """
+        Return the database that validation & saving should use
+
+        This is the database that the booking's schedule lives on.
+        """
+        return get_schedule_database(
+            type(self), *Meta.get_schedule_key(self), instance=self
+        )
+
+    @classmethod
+    def expire_stale(
+        cls,
+        cutoff: datetime,
+        states: Iterable[str],
+        new_state: str,
+        state_field: str = "state",
+        batch_size: int = 500,
+        using: str = None,
+    ) -> int:
+        """
+        Move bookings whose time slots all ended by cutoff to a new state
+
+        This is meant to be run periodically, to expire bookings that never
+        got confirmed. Unlike saving the bookings one by one, it updates them
+        in batches of batch_size, and releases their time slots (and
+        padding) with a couple of deletes per batch. No ``save`` methods or
+        signals get run, and nothing else should refer to the time slots.
+
+        :param states: The states that bookings can be expired from
+        :param new_state: The state to move them to, which shouldn't reserve
+            any time
+        :param using: The database to use. With a shard resolver, this
+            needs to be run for each shard.
+        :returns: The number of bookings expired
+        """
+        if using is None:
+            using = router.db_for_write(cls)
+        states = list(states)
+        ts_cls = cls._meta.get_field("time_slots").related_model
+        booking_field = TimeSlotMeta.get_booking_field(ts_cls)
+        schedule_field = cls._meta.get_field(Meta.get_schedule_field(cls))
+        stale = (
+            cls.objects.using(using)
+            .filter(**{state_field + "__in": states})
+            .annotate(agenda_last_end=models.Max("time_slots__end"))
+            .filter(agenda_last_end__lte=cutoff)
+            .order_by("pk")
+        )
+        values = {state_field: new_state}
+        total = 0
+        while True:
+            with transaction.atomic(using=using):
+                candidates = list(stale.values_list("pk", flat=True)[:batch_size])
+                if not candidates:
+                    break
+                # lock them, and check them again, in case they changed since
+                # (the aggregate can't be locked directly)
+                rows = list(
+                    cls.objects.using(using)
+                    .select_for_update()
+                    .filter(pk__in=candidates, **{state_field + "__in": states})
+                    .exclude(time_slots__end__gt=cutoff)
+                    .values_list("pk", schedule_field.attname)
+                )
+                ids = [pk for pk, _schedule_id in rows]
+                slots = ts_cls.objects.using(using).filter(
+                    **{booking_field + "__in": ids}
+                )
+                released = _release_time_slots(slots, using)
+                for field in cls._meta.concrete_fields:
+                    if getattr(field, "auto_now", False):
+                        values[field.name] = django.utils.timezone.now()
+                cls.objects.using(using).filter(pk__in=ids).update(**values)
+                for schedule_id in {schedule_id for _pk, schedule_id in rows}:
+                    _schedule_changed(
+                        schedule_field.related_model,
+                        schedule_id,
+                        using,
+                        kind=AgendaChange.BOOKING,
+                        spans=released[schedule_id],
+                    )
+            total += len(rows)
+            if len(candidates) < batch_size:
+                break
+        return total
+
     def time_slot_diff(self):
         """
         Return the difference between the existing time slots and the ones
@@ -486,15 +1943,143 @@ class AbstractBooking(models.Model, metaclass=Meta):
         Only returns changed time slots.
 
         :returns: Tuple of a list of new time spans and a list of old
-            time slots
+            time slots. The old time slots are ``(id, start, end)`` named
+            tuples rather than model instances.
+        """
+        slots = []
+        if self.pk is not None:
+            slots = self.time_slots.using(self._get_write_database()).values_list(
+                "id", "start", "end", named=True
+            )
+        return self._diff_time_slots(slots)
+
+    @classmethod
+    def time_slot_diffs(
+        cls,
+        bookings: Iterable["AbstractBooking"],
+        apply: bool = False,
+        using: str = None,
+    ) -> Dict[object, Tuple[List[PaddedTimeSpan], list]]:
+        """
+        Return `time_slot_diff` for many bookings at once
+
+        This is for jobs that re-evaluate lots of bookings, like data
+        migrations, or changes to ``get_reserved_spans``. All the bookings'
+        time slots are read with a single query.
+
+        :param apply: Also update the time slots, with a few bulk statements
+            in a single transaction. Like `BookingQuerySet.transition`,
+            this doesn't call ``save`` or send signals.
+        :param using: The database to use. With a shard resolver, this
+            needs to be run for each shard.
+        :returns: A dictionary mapping each booking's primary key to its
+            diff
+        """
+        bookings = list(bookings)
+        if not bookings:
+            return {}
+        if using is None:
+            using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            diffs = cls._get_time_slot_diffs(bookings, using)
+            if apply:
+                cls._apply_time_slot_diffs(bookings, diffs, using)
+        return diffs
+
+    @classmethod
+    def _get_time_slot_diffs(cls, bookings: list, using: str) -> dict:
+        ts_cls = cls._meta.get_field("time_slots").related_model
+        booking_field = ts_cls._meta.get_field(TimeSlotMeta.get_booking_field(ts_cls))
+        existing = defaultdict(list)
+        slot_rows = (
+            ts_cls.objects.using(using)
+            .filter(**{booking_field.name + "__in": [b.pk for b in bookings]})
+            .values_list(booking_field.attname, "id", "start", "end", named=True)
+        )
+        for row in slot_rows:
+            existing[row[0]].append(row)
+        return {
+            booking.pk: booking._diff_time_slots(existing[booking.pk])
+            for booking in bookings
+        }
+
+    @classmethod
+    def _apply_time_slot_diffs(cls, bookings: list, diffs: dict, using: str):
+        """
+        Release & reserve time slots from `_get_time_slot_diffs`
+
+        This should be run inside a transaction.
+        """
+        ts_cls = cls._meta.get_field("time_slots").related_model
+        booking_field = TimeSlotMeta.get_booking_field(ts_cls)
+        schedule_field = cls._meta.get_field(Meta.get_schedule_field(cls))
+        ts_schedule_field = ts_cls._meta.get_field(Meta.get_schedule_field(ts_cls))
+        ts_manager = ts_cls.objects.db_manager(using)
+
+        rm_ids = []
+        new_slots = []
+        schedule_ids = set()
+        for booking in bookings:
+            add_times, rm_slots = diffs[booking.pk]
+            if add_times or rm_slots:
+                schedule_ids.add(getattr(booking, schedule_field.attname))
+            rm_ids.extend(slot.id for slot in rm_slots)
+            busy = booking.is_booked_slot_busy()
+            ts_params = Meta.get_schedule_params(ts_cls, booking)
+            ts_params[booking_field] = booking
+            for span in add_times:
+                slot = ts_cls(start=span.start, end=span.end, busy=busy, **ts_params)
+                new_slots.append((span, slot))
+
+        changed = defaultdict(list)
+        if rm_ids:
+            changed = _release_time_slots(ts_manager.filter(pk__in=rm_ids), using)
+        _bulk_create(ts_cls, [slot for _span, slot in new_slots], using=using)
+        padded_slots = []
+        for span, slot in new_slots:
+            schedule_id = getattr(slot, ts_schedule_field.attname)
+            changed[schedule_id].append(TimeSpan(span.padded_start, span.padded_end))
+            if span.padded_start == span.start:
+                continue
+            ts_params = Meta.get_schedule_params(ts_cls, slot)
+            padded_slots.append(
+                ts_cls(
+                    start=span.padded_start,
+                    end=span.start,
+                    busy=True,
+                    padding_for=slot,
+                    **ts_params
+                )
+            )
+            padded_slots.append(
+                ts_cls(
+                    start=span.end,
+                    end=span.padded_end,
+                    busy=True,
+                    padding_for=slot,
+                    **ts_params
+                )
+            )
+        ts_manager.bulk_create(padded_slots)
+        for schedule_id in schedule_ids:
+            _schedule_changed(
+                schedule_field.related_model,
+                schedule_id,
+                using,
+                kind=AgendaChange.BOOKING,
+                spans=changed[schedule_id],
+            )
+
+    def _diff_time_slots(self, slots):
+        """
+        `time_slot_diff`, for time slots that have already been read
         """
         slot_times = dict()
         add_times = []
         padding = self.get_padding()
         # add all the slots to slot_times
-        if self.pk is not None:
-            for slot in self.time_slots.all():
-                slot_times[(slot.start, slot.end)] = slot
+        for slot in slots:
+            slot_times[(slot.start, slot.end)] = slot
         # make a diff out of slot_times
         for start, end in self.get_reserved_spans():
             start_utc = start.astimezone(pytz.utc)
@@ -511,28 +2096,40 @@ class AbstractBooking(models.Model, metaclass=Meta):
         new_spans = [TimeSpan(x.start, x.end) for x in self.get_reserved_spans()]
         new_spans = set(TimeSpan.merge_spans(new_spans))
 
+        # validation always reads from the write database, since a
+        # replica might not have the latest bookings
+        using = self._get_write_database()
+
         # these are the spans we already have, we don't need to validate
         # new ones if they match these
-        for slot in self.time_slots.all():
-            new_spans.discard(TimeSpan(slot.start, slot.end))
+        for start, end in self.time_slots.using(using).spans():
+            new_spans.discard(TimeSpan(start, end))
 
         ts_cls = self.time_slots.model
         schedule = Meta.get_schedule(self)
-        ao_cls = schedule.availability_occurrences.model
 
         for span in new_spans:
             # make sure there is available time
             if not self.can_book_unscheduled():
-                params = {
-                    Meta.get_schedule_field(ao_cls): getattr(
-                        self, Meta.get_schedule_field(self)
+                availabilities = get_availabilities(schedule, span.end)
+                if availabilities is not None:
+                    free_times = get_occurrences(
+                        availabilities.using(using), span.start, span.end
                     )
-                }
-                free_times = ao_cls.objects.filter(
-                    start__lt=span.end, end__gt=span.start, **params
-                )
-                free_spans = TimeSpan.merge_spans(
-                    (TimeSpan(ao.start, ao.end) for ao in free_times)
+                else:
+                    extend_occurrences(schedule, span.end, using)
+                    free_times = (
+                        _get_occurrence_spans(schedule, span.start, span.end)
+                        .using(using)
+                        .order_by("start")
+                        .spans()
+                    )
+                free_spans = _subtract_blackouts(
+                    schedule,
+                    list(TimeSpan.merge_sorted_spans(free_times)),
+                    span.start,
+                    span.end,
+                    using,
                 )
                 # the time should be free iff there is one merged span
                 # and it goes the whole time
@@ -554,7 +2151,7 @@ class AbstractBooking(models.Model, metaclass=Meta):
                 }
                 # exclude slots from my own booking
                 booking_field = TimeSlotMeta.get_booking_field(ts_cls)
-                busy_q = ts_cls.objects.filter(
+                busy_q = ts_cls.objects.using(using).filter(
                     start__lt=span.end, end__gt=span.start, busy=True, **params
                 )
                 if self.id is not None:
@@ -572,20 +2169,30 @@ class AbstractBooking(models.Model, metaclass=Meta):
         add_times, rm_slots = self.time_slot_diff()
         padding = self.get_padding()
         ts_cls = self.time_slots.model
-        ts_params = {Meta.get_schedule_field(ts_cls): Meta.get_schedule(self)}
+        ts_params = Meta.get_schedule_params(ts_cls, self)
+        using = kwargs.get("using") or self._get_write_database()
+        kwargs["using"] = using
+        ts_manager = ts_cls.objects.db_manager(using)
 
-        with transaction.atomic():
+        changed = [TimeSpan(span.padded_start, span.padded_end) for span in add_times]
+
+        with transaction.atomic(using=using):
             # clear slots in case that means we can book again
             # this is important for rescheduling, especially with lots
             # of padding
-            ts_cls.objects.filter(id__in=(s.id for s in rm_slots)).delete()
+            rm_ids = [s.id for s in rm_slots]
+            if rm_ids and _change_feed_enabled():
+                changed += ts_manager.filter(
+                    models.Q(id__in=rm_ids) | models.Q(padding_for__in=rm_ids)
+                ).spans()
+            ts_manager.filter(id__in=rm_ids).delete()
 
             # save this record
             super().save(*args, **kwargs)
             # add in new slots
             padded_slots = []
             for span in add_times:
-                new_slot = ts_cls.objects.create(
+                new_slot = ts_manager.create(
                     booking=self,
                     start=span.start,
                     end=span.end,
@@ -611,7 +2218,14 @@ class AbstractBooking(models.Model, metaclass=Meta):
                             **ts_params
                         )
                     )
-            ts_cls.objects.bulk_create(padded_slots)
+            ts_manager.bulk_create(padded_slots)
+            if add_times or rm_slots:
+                _schedule_changed(
+                    *Meta.get_schedule_key(self),
+                    using=using,
+                    kind=AgendaChange.BOOKING,
+                    spans=changed
+                )
         # end transaction
 
     def _padding_changed(self):
@@ -622,26 +2236,199 @@ class AbstractBooking(models.Model, metaclass=Meta):
         """
         padding_length = self.get_padding()
         ts_cls = self.time_slots.model
-        ts_params = {Meta.get_schedule_field(ts_cls): Meta.get_schedule(self)}
+        ts_params = Meta.get_schedule_params(ts_cls, self)
+        using = self._get_write_database()
+        ts_manager = ts_cls.objects.db_manager(using)
 
-        with transaction.atomic():
-            for slot in self.time_slots.all():
+        changed = []
+        with transaction.atomic(using=using):
+            for slot in self.time_slots.using(using):
                 # delete any existing padding
-                slot.padded_by.all().delete()
+                if _change_feed_enabled():
+                    changed += slot.padded_by.using(using).spans()
+                    if padding_length:
+                        changed.append(
+                            TimeSpan(slot.start - padding_length, slot.start)
+                        )
+                        changed.append(TimeSpan(slot.end, slot.end + padding_length))
+                slot.padded_by.using(using).delete()
 
                 # add new padding
                 if padding_length:
-                    ts_cls.objects.create(
+                    ts_manager.create(
                         start=slot.start - padding_length,
                         end=slot.start,
                         busy=True,
                         padding_for=slot,
                         **ts_params
                     )
-                    ts_cls.objects.create(
+                    ts_manager.create(
                         start=slot.end,
                         end=slot.end + padding_length,
                         busy=True,
                         padding_for=slot,
                         **ts_params
                     )
+            _schedule_changed(
+                *Meta.get_schedule_key(self),
+                using=using,
+                kind=AgendaChange.PADDING,
+                spans=changed
+            )
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or self._get_write_database()
+        changed = []
+        with transaction.atomic(using=using):
+            if _change_feed_enabled():
+                booking_field = TimeSlotMeta.get_booking_field(self.time_slots.model)
+                changed += (
+                    self.time_slots.model.objects.using(using)
+                    .filter(
+                        models.Q(**{booking_field: self})
+                        | models.Q(**{"padding_for__" + booking_field: self})
+                    )
+                    .spans()
+                )
+            result = super().delete(using, keep_parents)
+            _schedule_changed(
+                *Meta.get_schedule_key(self),
+                using=using,
+                kind=AgendaChange.BOOKING,
+                spans=changed
+            )
+        return result
+
+
+class AbstractBlackout(models.Model, metaclass=BlackoutMeta):
+    """
+    Time that isn't available in many schedules at once, like a public
+    holiday
+
+    See `django_agenda.blackouts`.
+    """
+
+    class Meta:
+        abstract = True
+
+    name = models.CharField(max_length=255, blank=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    all_schedules = models.BooleanField(
+        default=False, help_text=_("Applies to every schedule")
+    )
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            old = None
+            if self.pk is not None:
+                old = (
+                    type(self)
+                    .objects.using(using)
+                    .filter(pk=self.pk)
+                    .values_list("start", "end", "all_schedules")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            spans = [TimeSpan(self.start, self.end)]
+            if old is not None:
+                spans.append(TimeSpan(old[0], old[1]))
+            if self.all_schedules or (old is not None and old[2]):
+                self._schedules_changed([AgendaChange.ALL_SCHEDULES], spans)
+            elif old is not None:
+                # new blackouts get their schedules afterwards, and those are
+                # handled by the m2m_changed signal
+                self._schedules_changed(
+                    self.schedules.values_list("pk", flat=True), spans
+                )
+        _blackouts_changed(self._state.db)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        schedule_ids = [AgendaChange.ALL_SCHEDULES]
+        with transaction.atomic(using=using):
+            if not self.all_schedules:
+                schedule_ids = list(
+                    self.schedules.using(using).values_list("pk", flat=True)
+                )
+            result = super().delete(using, keep_parents)
+            self._schedules_changed(schedule_ids, [TimeSpan(self.start, self.end)])
+        _blackouts_changed(using)
+        return result
+
+    def __str__(self):
+        return self.name or str(TimeSpan(self.start, self.end))
+
+    @classmethod
+    def _get_schedule_model(cls):
+        return cls._meta.get_field("schedules").related_model
+
+    def _schedules_changed(self, schedule_ids: Iterable, spans: List[TimeSpan]):
+        _blackout_schedules_changed(
+            self._get_schedule_model(), schedule_ids, spans, self._state.db
+        )
+
+
+def _blackouts_changed(using: str):
+    # clear the cache now, so this transaction sees the change, and after
+    # the commit for every process, including any thread of this one that
+    # read the old blackouts meanwhile
+    blackout_cache.clear()
+    transaction.on_commit(blackout_cache.invalidate, using=using)
+
+
+def _blackout_schedules_changed(
+    schedule_model, schedule_ids: Iterable, spans: List[TimeSpan], using: str
+):
+    """
+    Bump the versions of schedules that a blackout change affects, and
+    record it in the change feed
+
+    A schedule id of `AgendaChange.ALL_SCHEDULES` is for blackouts that
+    apply to every schedule.
+    """
+    for schedule_id in schedule_ids:
+        _schedule_changed(
+            schedule_model, schedule_id, using, kind=AgendaChange.BLACKOUT, spans=spans,
+        )
+
+
+def _blackout_links_changed(
+    sender, instance, action, reverse, model, pk_set, using, **_kwargs
+):
+    if isinstance(instance, AbstractBlackout):
+        related = instance.schedules
+    elif issubclass(model, AbstractBlackout):
+        related = instance.blackouts
+    else:
+        return
+    if action == "pre_clear":
+        # the links are gone by the time post_clear is sent
+        instance._agenda_cleared = set(
+            related.using(using).values_list("pk", flat=True)
+        )
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_agenda_cleared", set())
+    elif not action.startswith("post_"):
+        return
+    if isinstance(instance, AbstractBlackout):
+        schedule_model = instance._get_schedule_model()
+        schedule_ids = pk_set
+        spans = [TimeSpan(instance.start, instance.end)]
+    else:
+        schedule_model = type(instance)
+        schedule_ids = [instance.pk]
+        rows = model.objects.using(using).filter(pk__in=pk_set or ())
+        spans = [
+            TimeSpan(start, end) for start, end in rows.values_list("start", "end")
+        ]
+    if pk_set and spans:
+        _blackout_schedules_changed(schedule_model, schedule_ids, spans, using)
+    _blackouts_changed(using)
+
+
+models.signals.m2m_changed.connect(
+    _blackout_links_changed, dispatch_uid="django_agenda_blackout_links"
+)
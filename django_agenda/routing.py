@@ -0,0 +1,125 @@
+"""
+Database routing for schedules
+
+Free time reads (``get_free_times``, ``get_slot_grid``) are read-only, and
+can be served from a read replica by setting::
+
+    AGENDA_READ_DATABASE = "replica"
+
+Booking validation and saving always happen on the write database, since
+they need to see the latest data.
+
+Replicas lag a little behind, so after django-agenda writes to a schedule,
+reads for that schedule go to the write database for a while. The length
+of that window (in seconds) is set with ``AGENDA_STALENESS_WINDOW``, and
+the recent writes are tracked in the cache named by ``AGENDA_CACHE``, so
+that every process sees them.
+
+To spread schedules over several databases (shards), give each model's
+``AgendaMeta`` a ``shard_resolver``, a function that takes a schedule model
+and a schedule id and returns a database alias::
+
+    def get_shard(schedule_model, schedule_id):
+        return "shard{}".format(schedule_id % 4)
+
+    class TimeSlot(AbstractTimeSlot):
+        class AgendaMeta:
+            schedule_model = Clinic
+            shard_resolver = get_shard
+
+All of a schedule's rows then get read & written on its shard, so booking
+transactions never span databases. Without a resolver, the database
+routers get asked, with ``schedule_model`` and ``schedule_id`` hints.
+``AGENDA_READ_DATABASE`` isn't used for models with a shard resolver.
+
+Schedules are keyed on their concrete model (see `get_schedule_model`), so
+instances of a proxy or a subclass of the schedule model share the rows,
+versions & routing of the schedule they are.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+
+__all__ = [
+    "get_schedule_database",
+    "get_schedule_model",
+    "get_read_database",
+    "mark_schedule_written",
+]
+
+DEFAULT_STALENESS_WINDOW = 5
+
+
+def _get_cache():
+    return caches[getattr(settings, "AGENDA_CACHE", "default")]
+
+
+def get_schedule_model(schedule_model):
+    """
+    Return the model that a schedule model's rows are keyed on
+
+    That's the concrete model, or for a multi-table subclass the concrete
+    model at the root of its parents, which has the same primary keys.
+    """
+    model = schedule_model._meta.concrete_model
+    parents = model._meta.get_parent_list()
+    roots = [parent for parent in parents if not parent._meta.parents]
+    return roots[0] if roots else model
+
+
+def _get_key(schedule_model, schedule_id) -> str:
+    return "django_agenda:written:{}:{}".format(
+        get_schedule_model(schedule_model)._meta.label_lower, schedule_id
+    )
+
+
+def _get_shard_resolver(model):
+    meta = getattr(model, "AgendaMeta", None)
+    return getattr(meta, "shard_resolver", None)
+
+
+def get_schedule_database(model, schedule_model, schedule_id, instance=None) -> str:
+    """
+    Return the database that holds a schedule's rows of a model
+    """
+    schedule_model = get_schedule_model(schedule_model)
+    resolver = _get_shard_resolver(model)
+    if resolver is not None:
+        return resolver(schedule_model, schedule_id)
+    return router.db_for_write(
+        model, instance=instance, schedule_model=schedule_model, schedule_id=schedule_id
+    )
+
+
+def get_read_database(schedule, model=None):
+    """
+    Return the database alias that free time reads for a schedule should use
+
+    :param model: The model being read, used to find the schedule's shard,
+        or the write database when the replica might be stale
+    :returns: ``None`` if the normal routing should be used
+    """
+    model = model or type(schedule)
+    if _get_shard_resolver(model) is not None:
+        return get_schedule_database(model, type(schedule), schedule.pk)
+    replica = getattr(settings, "AGENDA_READ_DATABASE", None)
+    if replica is None:
+        return None
+    if _get_cache().get(_get_key(type(schedule), schedule.pk)):
+        return get_schedule_database(model, type(schedule), schedule.pk)
+    return replica
+
+
+def mark_schedule_written(schedule_model, schedule_id, using=None):
+    """
+    Note that a schedule changed, so its reads go to the write database
+
+    The window starts when the current transaction commits.
+    """
+    if getattr(settings, "AGENDA_READ_DATABASE", None) is None:
+        return
+    window = getattr(settings, "AGENDA_STALENESS_WINDOW", DEFAULT_STALENESS_WINDOW)
+    key = _get_key(schedule_model, schedule_id)
+    transaction.on_commit(
+        lambda: _get_cache().set(key, True, timeout=window), using=using
+    )
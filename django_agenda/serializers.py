@@ -0,0 +1,154 @@
+"""
+Compact encodings for lists of time spans
+
+Free time spans tend to get sent over the wire a lot, and ISO-8601 strings
+are fairly verbose. These functions encode spans as integer seconds since
+the epoch (UTC), in one of two layouts:
+
+``PAIRS``
+    ``[[start, end], [start, end], ...]``
+
+``DELTAS``
+    A flat list ``[start, length, gap, length, gap, length, ...]``, where
+    the first number is the start of the first span, and every ``gap`` is
+    the time between the end of the previous span and the start of the
+    next one. For sorted spans, this keeps most numbers small.
+
+The streaming functions consume spans lazily, so they can be fed straight
+into a ``StreamingHttpResponse``. With `django_agenda.models.iter_free_times`,
+the free times are read from the database as they get sent::
+
+    spans = iter_free_times(schedule, start, end)
+    return StreamingHttpResponse(
+        stream_json(spans, DELTAS), content_type="application/json"
+    )
+
+msgpack output requires the ``msgpack`` package.
+"""
+import calendar
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, List
+
+import pytz
+
+from .time_span import AbstractTimeSpan, TimeSpan
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = [
+    "PAIRS",
+    "DELTAS",
+    "encode_spans",
+    "decode_spans",
+    "dumps",
+    "stream_json",
+    "stream_msgpack",
+]
+
+PAIRS = "pairs"
+DELTAS = "deltas"
+
+
+def to_epoch(value: datetime) -> int:
+    return calendar.timegm(value.utctimetuple())
+
+
+def from_epoch(value: int) -> datetime:
+    return datetime.fromtimestamp(value, pytz.utc)
+
+
+def _iter_encoded(spans: Iterable[AbstractTimeSpan], layout: str):
+    """
+    Yield the items of the encoded list one by one
+    """
+    if layout == PAIRS:
+        for span in spans:
+            yield [to_epoch(span.start), to_epoch(span.end)]
+    elif layout == DELTAS:
+        last_end = None
+        for span in spans:
+            start = to_epoch(span.start)
+            end = to_epoch(span.end)
+            yield start if last_end is None else start - last_end
+            yield end - start
+            last_end = end
+    else:
+        raise ValueError("Unknown span layout: {}".format(layout))
+
+
+def encode_spans(spans: Iterable[AbstractTimeSpan], layout: str = PAIRS) -> list:
+    """
+    Encode spans into a list of integers (or integer pairs)
+    """
+    return list(_iter_encoded(spans, layout))
+
+
+def decode_spans(data: list, layout: str = PAIRS) -> List[TimeSpan]:
+    """
+    Turn the output of `encode_spans` back into spans, in UTC
+    """
+    if layout == PAIRS:
+        return [TimeSpan(from_epoch(start), from_epoch(end)) for start, end in data]
+    elif layout == DELTAS:
+        result = []
+        last_end = 0
+        for idx in range(0, len(data), 2):
+            start = last_end + data[idx]
+            last_end = start + data[idx + 1]
+            result.append(TimeSpan(from_epoch(start), from_epoch(last_end)))
+        return result
+    raise ValueError("Unknown span layout: {}".format(layout))
+
+
+def dumps(
+    spans: Iterable[AbstractTimeSpan], layout: str = PAIRS, encoding: str = "json"
+) -> bytes:
+    """
+    Encode spans as a JSON or msgpack document
+    """
+    data = encode_spans(spans, layout)
+    if encoding == "json":
+        return json.dumps(data, separators=(",", ":")).encode()
+    elif encoding == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack must be installed to use msgpack encoding")
+        return msgpack.packb(data)
+    raise ValueError("Unknown encoding: {}".format(encoding))
+
+
+def stream_json(
+    spans: Iterable[AbstractTimeSpan], layout: str = PAIRS
+) -> Iterator[bytes]:
+    """
+    Yield a JSON array of encoded spans, piece by piece
+
+    The output is the same as `dumps`, but spans are consumed as they're
+    needed.
+    """
+    yield b"["
+    separator = b""
+    for item in _iter_encoded(spans, layout):
+        yield separator + json.dumps(item, separators=(",", ":")).encode()
+        separator = b","
+    yield b"]"
+
+
+def stream_msgpack(
+    spans: Iterable[AbstractTimeSpan], layout: str = PAIRS
+) -> Iterator[bytes]:
+    """
+    Yield a stream of msgpack objects, one per encoded item
+
+    Since msgpack arrays have to know their length in advance, this doesn't
+    produce a single array, but a sequence of objects that can be read with
+    ``msgpack.Unpacker``.
+    """
+    if msgpack is None:
+        raise RuntimeError("msgpack must be installed to use msgpack encoding")
+    packer = msgpack.Packer()
+    for item in _iter_encoded(spans, layout):
+        yield packer.pack(item)
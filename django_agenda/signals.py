@@ -0,0 +1,182 @@
+"""
+Signal integration for keeping availability occurrences up to date
+
+Regenerating occurrences is relatively expensive, and when several
+availabilities get saved in the same transaction (say, from an admin action
+or a formset) it's wasteful to regenerate after every single save. The
+:class:`OccurrenceRegenerator` collects the availabilities that were saved
+during a transaction, and regenerates each of them once after the
+transaction commits.
+
+Usage::
+
+    from django_agenda.signals import OccurrenceRegenerator
+
+    regenerator = OccurrenceRegenerator(Availability)
+    regenerator.connect()
+
+The regeneration can be handed off to an executor so the request doesn't
+have to wait for it. Anything with a ``submit`` method (like a
+``concurrent.futures.ThreadPoolExecutor``) works, as does a plain callable
+that accepts the function and its arguments, which makes it easy to hand
+off to a task queue::
+
+    regenerator = OccurrenceRegenerator(
+        Availability,
+        executor=lambda func, *args: regenerate_task.delay(*args),
+    )
+
+In that case, ``regenerate_task`` should call :func:`regenerate_occurrences`
+with the arguments it receives.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import django.utils.timezone
+from django.apps import apps
+from django.db import router, transaction
+from django.db.models import signals
+from django.dispatch import Signal
+
+from .models import Meta
+
+__all__ = [
+    "OccurrenceRegenerator",
+    "occurrences_regenerated",
+    "regenerate_occurrences",
+]
+
+# sent once per schedule after its dirty availabilities have been
+# regenerated, providing ``schedule_id``, ``start`` and ``end``
+occurrences_regenerated = Signal(providing_args=["schedule_id", "start", "end"])
+
+
+def regenerate_occurrences(
+    model_label: str,
+    pks: Iterable,
+    start: datetime,
+    end: datetime,
+    using=None,
+    states: Iterable = None,
+):
+    """
+    Regenerate the occurrences of a group of availabilities
+
+    The availabilities are re-read from the database, so this can safely run
+    some time after (or in a different process from) the original save.
+    Availabilities that don't exist any more are skipped.
+
+    :param model_label: The ``app_label.ModelName`` of the availability model
+    :param pks: Primary keys of the availabilities to regenerate
+    :param states: The state that each availability's occurrences were
+        generated from before it was saved (or ``None``), in the same order
+        as pks. With it, only the affected dates are regenerated when only
+        exclusions or a rule's ``UNTIL`` changed.
+    """
+    model = apps.get_model(model_label)
+    schedule_attname = model._meta.get_field(Meta.get_schedule_field(model)).attname
+    queryset = model.objects.all()
+    if using is not None:
+        queryset = queryset.using(using)
+    pks = list(pks)
+    old_states = dict(zip(pks, states or ()))
+    schedule_ids = OrderedDict()
+    for availability in queryset.filter(pk__in=pks):
+        old_state = old_states.get(availability.pk)
+        if old_state is not None:
+            availability._generated_state = old_state
+        availability.recreate_occurrences(start, end)
+        schedule_ids[getattr(availability, schedule_attname)] = True
+    for schedule_id in schedule_ids:
+        occurrences_regenerated.send(
+            sender=model, schedule_id=schedule_id, start=start, end=end
+        )
+
+
+class OccurrenceRegenerator:
+    """
+    Regenerate availability occurrences once per transaction
+
+    Saved availabilities are marked as dirty, and when the transaction
+    commits each of them is regenerated once, between now and
+    ``now + horizon``. Outside of a transaction, the regeneration happens
+    right away, just like the naive ``post_save`` approach.
+
+    Dirty availabilities are grouped by schedule, and each schedule is
+    handed to the executor as a single job.
+    """
+
+    def __init__(self, availability_model, horizon=timedelta(days=100), executor=None):
+        self.availability_model = availability_model
+        self.horizon = horizon
+        self.executor = executor
+        self._local = threading.local()
+
+    def connect(self):
+        signals.post_save.connect(
+            self._post_save, sender=self.availability_model, dispatch_uid=id(self)
+        )
+
+    def disconnect(self):
+        signals.post_save.disconnect(
+            sender=self.availability_model, dispatch_uid=id(self)
+        )
+
+    def _post_save(self, sender, instance, raw=False, using=None, **_kwargs):
+        if raw:
+            return
+        self.mark_dirty(instance, using=using)
+
+    def _get_pending(self, using):
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            pending = self._local.pending = {}
+        return pending.setdefault(using, OrderedDict())
+
+    def mark_dirty(self, availability, using=None):
+        """
+        Schedule an availability for regeneration when the transaction commits
+        """
+        if using is None:
+            using = router.db_for_write(type(availability), instance=availability)
+        field = availability._meta.get_field(Meta.get_schedule_field(availability))
+        schedule_id = getattr(availability, field.attname)
+        pending = self._get_pending(using)
+        # keep the state from before the first save, so the job knows what
+        # changed since the occurrences were generated
+        pending.setdefault(schedule_id, OrderedDict()).setdefault(
+            availability.pk, getattr(availability, "_generated_state", None)
+        )
+        # the job works on a fresh copy, so a later save of this instance
+        # should be compared with what this save generates
+        availability._generated_state = availability._get_generation_state()
+        # every save registers a callback, the first one to run does all the
+        # work. If the transaction gets rolled back, the left over entries get
+        # picked up by the next commit, which is harmless since they're
+        # re-read from the database.
+        transaction.on_commit(lambda: self.flush(using), using=using)
+
+    def flush(self, using=None):
+        """
+        Regenerate all the dirty availabilities for a database
+        """
+        if using is None:
+            using = router.db_for_write(self.availability_model)
+        pending = self._get_pending(using)
+        if not pending:
+            return
+        jobs = list(pending.items())
+        pending.clear()
+        start = django.utils.timezone.now()
+        end = start + self.horizon
+        label = self.availability_model._meta.label
+        for _schedule_id, states in jobs:
+            args = (label, list(states), start, end, using, list(states.values()))
+            if self.executor is None:
+                regenerate_occurrences(*args)
+            elif hasattr(self.executor, "submit"):
+                self.executor.submit(regenerate_occurrences, *args)
+            else:
+                self.executor(regenerate_occurrences, *args)
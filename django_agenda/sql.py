@@ -0,0 +1,115 @@
+"""
+Free time calculations done inside the database
+
+For schedules with lots of occurrences and busy slots, it's a waste to
+send every row to Python just to work out a handful of free spans. The
+query here turns the occurrences and busy slots into a list of boundary
+points, keeps running totals of how many occurrences and busy slots are
+"open" at each point, and then groups consecutive free segments together
+(the classic gaps-and-islands problem).
+
+This requires window functions, which are available in PostgreSQL and in
+SQLite 3.25 or newer.
+"""
+import sqlite3
+from datetime import datetime
+from typing import List
+
+import django.utils.timezone
+import pytz
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from .time_span import TimeSpan
+
+__all__ = ["supports_window_functions", "get_free_times_sql"]
+
+FREE_TIMES_SQL = """
+WITH occ AS ({occurrences}),
+busy AS ({busy}),
+events (t, da, db) AS (
+    SELECT span_start, 1, 0 FROM occ
+    UNION ALL SELECT span_end, -1, 0 FROM occ
+    UNION ALL SELECT span_start, 0, 1 FROM busy
+    UNION ALL SELECT span_end, 0, -1 FROM busy
+),
+points AS (
+    SELECT t, SUM(da) AS da, SUM(db) AS db FROM events GROUP BY t
+),
+running AS (
+    SELECT
+        t,
+        LEAD(t) OVER (ORDER BY t) AS next_t,
+        SUM(da) OVER (ORDER BY t) AS open_occ,
+        SUM(db) OVER (ORDER BY t) AS open_busy
+    FROM points
+),
+segments AS (
+    SELECT
+        t,
+        next_t,
+        CASE WHEN open_occ > 0 AND open_busy <= 0 THEN 1 ELSE 0 END AS free
+    FROM running
+    WHERE next_t IS NOT NULL
+),
+changes AS (
+    SELECT
+        t,
+        next_t,
+        free,
+        CASE WHEN free = LAG(free) OVER (ORDER BY t) THEN 0 ELSE 1 END AS is_new
+    FROM segments
+),
+islands AS (
+    SELECT t, next_t, free, SUM(is_new) OVER (ORDER BY t) AS island
+    FROM changes
+)
+SELECT MIN(t), MAX(next_t) FROM islands
+WHERE free = 1
+GROUP BY island
+ORDER BY 1
+"""
+
+
+def supports_window_functions(connection) -> bool:
+    """
+    Return True if `get_free_times_sql` can run on a connection
+    """
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    return False
+
+
+def _to_datetime(value) -> datetime:
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if django.utils.timezone.is_naive(value):
+        value = django.utils.timezone.make_aware(value, pytz.utc)
+    return value
+
+
+def _compile(queryset, connection):
+    queryset = queryset.order_by().values(span_start=F("start"), span_end=F("end"))
+    return queryset.query.get_compiler(connection=connection).as_sql()
+
+
+def get_free_times_sql(occurrences, busy_slots, connection) -> List[TimeSpan]:
+    """
+    Work out the free time spans in the database
+
+    The results are the same as `django_agenda.models.get_free_times`.
+
+    :param occurrences: A queryset of the availability occurrences to use
+    :param busy_slots: A queryset of the busy time slots to use
+    """
+    occ_sql, occ_params = _compile(occurrences, connection)
+    busy_sql, busy_params = _compile(busy_slots, connection)
+    sql = FREE_TIMES_SQL.format(occurrences=occ_sql, busy=busy_sql)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, tuple(occ_params) + tuple(busy_params))
+        return [
+            TimeSpan(_to_datetime(start), _to_datetime(end))
+            for start, end in cursor.fetchall()
+        ]
@@ -1,5 +1,6 @@
+import heapq
 from datetime import datetime, timedelta
-from typing import List
+from typing import Iterable, Iterator, List
 
 from django.conf import settings
 from django.utils.dateformat import DateFormat, TimeFormat
@@ -62,25 +63,74 @@ class TimeSpan(AbstractTimeSpan):
         self.end = end
 
     @staticmethod
-    def merge_spans(spans: List[AbstractTimeSpan]) -> 'List[TimeSpan]':
+    def merge_spans(spans: Iterable[AbstractTimeSpan]) -> 'List[TimeSpan]':
         """
         Return a list that has any overlapping spans joined
         """
-        result = []
-        it_sort = iter(sorted(spans, key=lambda x: x.start))
+        return list(TimeSpan.merge_sorted_spans(
+            sorted(spans, key=lambda x: x.start)))
+
+    @staticmethod
+    def merge_sorted_spans(
+            spans: Iterable[AbstractTimeSpan]) -> 'Iterator[TimeSpan]':
+        """
+        Join any overlapping spans, for spans that are already sorted by start
+
+        This runs in linear time and consumes the spans lazily, so it
+        works well with generators and database cursors.
+        """
+        it_spans = iter(spans)
         try:
-            first = next(it_sort)
+            first = next(it_spans)
         except StopIteration:
-            return result
+            return
         last_start = first.start
         last_end = first.end
-        for span in it_sort:
+        for span in it_spans:
             if span.start > last_end:
-                result.append(TimeSpan(last_start, last_end))
+                yield TimeSpan(last_start, last_end)
                 last_start = span.start
-            last_end = span.end
-        result.append(TimeSpan(last_start, last_end))
-        return result
+                last_end = span.end
+            elif span.end > last_end:
+                last_end = span.end
+        yield TimeSpan(last_start, last_end)
+
+    @staticmethod
+    def merge_span_streams(
+            *streams: Iterable[AbstractTimeSpan]) -> 'Iterator[TimeSpan]':
+        """
+        Join overlapping spans from several streams that are each sorted by
+        start
+
+        This does a k-way merge, so it runs in O(n log k) for k streams.
+        """
+        return TimeSpan.merge_sorted_spans(
+            heapq.merge(*streams, key=lambda x: x.start))
+
+    @staticmethod
+    def subtract_sorted_spans(
+            spans: Iterable[AbstractTimeSpan],
+            others: Iterable[AbstractTimeSpan]) -> 'Iterator[TimeSpan]':
+        """
+        Yield the parts of spans that aren't covered by others
+
+        Both have to be sorted by start & merged. They're consumed lazily,
+        so either can be a generator or database cursor.
+        """
+        it_others = iter(others)
+        other = next(it_others, None)
+        for span in spans:
+            start = span.start
+            while other is not None and other.start < span.end:
+                if other.start > start:
+                    yield TimeSpan(start, other.start)
+                start = max(start, other.end)
+                if other.end > span.end:
+                    # it might cover the next span too
+                    break
+                other = next(it_others, None)
+            if start < span.end:
+                yield TimeSpan(start, span.end)
 
     def __eq__(self, other: 'TimeSpan'):
         return self.start == other.start and self.end == other.end
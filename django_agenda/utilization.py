@@ -0,0 +1,221 @@
+"""
+Per-day totals of available, busy and free time
+
+Dashboards tend to want numbers like "how much of each provider's time was
+booked each day this month". Rather than calling ``get_free_times`` for
+every schedule & day, `get_daily_utilization` reads the occurrences and
+time slots of all the schedules at once, and sweeps over them a single
+time::
+
+    report = get_daily_utilization(doctors, date(2020, 3, 1), date(2020, 3, 31))
+    for day, totals in report[doctor.pk].items():
+        print(day, totals.free.total_seconds() // 60)
+
+Days start at midnight in each schedule's own time zone, which is taken
+from the schedule's ``get_timezone()`` method if it has one (or a
+``get_timezone`` function passed in), and the current time zone otherwise.
+"""
+import itertools
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple
+
+import django.utils.timezone
+
+from .blackouts import get_schedule_blackouts
+from .models import Meta, ScheduleVersion, extend_occurrences
+from .routing import get_read_database, get_schedule_model
+from .time_span import AbstractTimeSpan, TimeSpan
+from .virtual import get_occurrences, is_materialized
+
+__all__ = ["DayUtilization", "get_daily_utilization"]
+
+
+class DayUtilization(NamedTuple):
+    """
+    The totals for one schedule on one day
+    """
+
+    #: time covered by availabilities, and not blacked out
+    available: timedelta
+    #: time covered by busy, booked time slots
+    busy: timedelta
+    #: time covered by padding, that isn't already busy
+    padding: timedelta
+    #: available time that isn't busy or padding
+    free: timedelta
+
+
+def _get_days(start_date: date, end_date: date, zone) -> List[TimeSpan]:
+    days = []
+    day = start_date
+    while day <= end_date:
+        midnight = datetime.combine(day, datetime.min.time())
+        next_midnight = midnight + timedelta(days=1)
+        days.append(TimeSpan(zone.localize(midnight), zone.localize(next_midnight)))
+        day += timedelta(days=1)
+    return days
+
+
+def _daily_totals(spans: Iterable[AbstractTimeSpan], days: List[TimeSpan]) -> list:
+    """
+    Add up how much of each day the (sorted, merged) spans cover
+    """
+    totals = [timedelta(0)] * len(days)
+    idx = 0
+    for span in spans:
+        while idx < len(days) and days[idx].end <= span.start:
+            idx += 1
+        day_idx = idx
+        while day_idx < len(days) and days[day_idx].start < span.end:
+            day = days[day_idx]
+            totals[day_idx] += min(span.end, day.end) - max(span.start, day.start)
+            day_idx += 1
+    return totals
+
+
+def _by_schedule(rows) -> Dict[object, list]:
+    """
+    Group rows (that are sorted by schedule) by their first column
+    """
+    return {
+        key: list(group) for key, group in itertools.groupby(rows, key=lambda r: r[0])
+    }
+
+
+def _extend_lagging(schedules: list, end: datetime):
+    """
+    Generate any missing occurrences, checking all the schedules at once
+    """
+    lagging = set(
+        ScheduleVersion.objects.filter(
+            schedule_type=get_schedule_model(type(schedules[0]))._meta.label_lower,
+            schedule_id__in=[str(schedule.pk) for schedule in schedules],
+            materialized_until__lt=end,
+        ).values_list("schedule_id", flat=True)
+    )
+    for schedule in schedules:
+        if str(schedule.pk) in lagging:
+            extend_occurrences(schedule, end)
+
+
+def get_daily_utilization(
+    schedules: Iterable,
+    start_date: date,
+    end_date: date,
+    get_timezone: Callable = None,
+    using: str = None,
+) -> Dict[object, Dict[date, DayUtilization]]:
+    """
+    Return the daily totals for each schedule, from start_date to end_date
+    inclusive
+
+    All the schedules have to be of the same model.
+
+    :param get_timezone: A function that returns a schedule's time zone
+    :param using: The database to read from. By default, schedules are
+        read from the database that `get_free_times` would use.
+    :returns: A dictionary mapping each schedule's primary key to an
+        ordered dictionary of dates & `DayUtilization` values
+    """
+    schedules = list(schedules)
+    if not schedules:
+        return {}
+    current_zone = django.utils.timezone.get_current_timezone()
+    days = {}
+    for schedule in schedules:
+        if get_timezone is not None:
+            zone = get_timezone(schedule)
+        elif hasattr(schedule, "get_timezone"):
+            zone = schedule.get_timezone()
+        else:
+            zone = current_zone
+        days[schedule.pk] = _get_days(start_date, end_date, zone)
+    start = min(d[0].start for d in days.values())
+    end = max(d[-1].end for d in days.values())
+
+    availabilities = schedules[0].availabilities
+    ts_cls = schedules[0].time_slots.model
+    ts_field = ts_cls._meta.get_field(Meta.get_schedule_field(ts_cls)).attname
+    virtual = not is_materialized(availabilities.model)
+    if not virtual:
+        _extend_lagging(schedules, end)
+
+    # group the schedules by database, so shards each get their own query
+    databases = defaultdict(list)
+    for schedule in schedules:
+        databases[using or get_read_database(schedule, ts_cls)].append(schedule.pk)
+
+    occurrences = {}
+    slots = {}
+    for database, pks in databases.items():
+        slot_q = ts_cls.objects.filter(
+            busy=True, end__gt=start, start__lt=end, **{ts_field + "__in": pks}
+        )
+        if virtual:
+            avail_cls = availabilities.model
+            avail_field = avail_cls._meta.get_field(
+                Meta.get_schedule_field(avail_cls)
+            ).attname
+            avail_q = avail_cls.objects.filter(
+                start_date__lte=(end + timedelta(days=1)).date(),
+                **{avail_field + "__in": pks}
+            ).order_by(avail_field)
+            if database is not None:
+                avail_q = avail_q.using(database)
+            for pk, group in itertools.groupby(
+                avail_q, key=lambda a: getattr(a, avail_field)
+            ):
+                occurrences[pk] = get_occurrences(group, start, end)
+        else:
+            ao_cls = schedules[0].availability_occurrences.model
+            ao_field = ao_cls._meta.get_field(Meta.get_schedule_field(ao_cls)).attname
+            ao_q = ao_cls.objects.filter(
+                end__gt=start, start__lt=end, **{ao_field + "__in": pks}
+            ).order_by(ao_field, "start")
+            if database is not None:
+                ao_q = ao_q.using(database)
+            ao_rows = ao_q.values_list(ao_field, "start", "end", named=True)
+            occurrences.update(_by_schedule(ao_rows.iterator()))
+        if database is not None:
+            slot_q = slot_q.using(database)
+        slot_rows = slot_q.order_by(ts_field, "start").values_list(
+            ts_field, "start", "end", "padding_for_id", named=True
+        )
+        slots.update(_by_schedule(slot_rows.iterator()))
+
+    blackouts = get_schedule_blackouts(schedules, start, end, using)
+    result = {}
+    for schedule in schedules:
+        schedule_days = days[schedule.pk]
+        available = list(
+            TimeSpan.subtract_sorted_spans(
+                TimeSpan.merge_sorted_spans(occurrences.get(schedule.pk, ())),
+                blackouts[schedule.pk],
+            )
+        )
+        schedule_slots = slots.get(schedule.pk, ())
+        busy = list(
+            TimeSpan.merge_sorted_spans(
+                row for row in schedule_slots if row.padding_for_id is None
+            )
+        )
+        padding = list(
+            TimeSpan.merge_sorted_spans(
+                row for row in schedule_slots if row.padding_for_id is not None
+            )
+        )
+        blocked = list(TimeSpan.merge_span_streams(busy, padding))
+        totals = zip(
+            _daily_totals(available, schedule_days),
+            _daily_totals(busy, schedule_days),
+            _daily_totals(TimeSpan.subtract_sorted_spans(padding, busy), schedule_days),
+            _daily_totals(
+                TimeSpan.subtract_sorted_spans(available, blocked), schedule_days
+            ),
+        )
+        result[schedule.pk] = OrderedDict(
+            (day.start.date(), DayUtilization(*day_totals))
+            for day, day_totals in zip(schedule_days, totals)
+        )
+    return result
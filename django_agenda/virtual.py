@@ -0,0 +1,144 @@
+"""
+Occurrences that are worked out on the fly
+
+Storing availability occurrences makes reads cheap, but for lots of
+schedules with simple weekly availabilities, it also means a lot of rows
+that have to be regenerated. Setting this in an availability model::
+
+    class Availability(AbstractAvailability):
+        class AgendaMeta:
+            schedule_model = Clinic
+            materialize_occurrences = False
+
+means that no occurrences get stored. Instead, free times and booking
+validation expand the availabilities' recurrences for the window they
+need.
+
+Expansions are cached in-process, in blocks of a week (aligned to the
+epoch), so that nearby windows share the work. The cache is keyed on the
+fields the occurrences are generated from, so editing an availability
+never returns stale occurrences. It holds at most
+``AGENDA_EXPANSION_CACHE_SIZE`` blocks (10,000 by default), dropping the
+least recently used ones first.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, List
+
+import pytz
+from django.conf import settings
+
+from .time_span import TimeSpan
+
+__all__ = ["is_materialized", "get_availabilities", "get_occurrences"]
+
+BLOCK = timedelta(days=7)
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+DEFAULT_CACHE_SIZE = 10000
+
+
+class ExpansionCache:
+    """
+    A thread safe, size bounded LRU cache
+    """
+
+    def __init__(self, max_size: int = None):
+        self._max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self) -> int:
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, "AGENDA_EXPANSION_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+expansion_cache = ExpansionCache()
+
+
+def is_materialized(model) -> bool:
+    """
+    Return True if the occurrences of an availability model are stored
+    """
+    meta = getattr(model, "AgendaMeta", None)
+    return getattr(meta, "materialize_occurrences", True)
+
+
+def get_availabilities(schedule, end: datetime):
+    """
+    Return the schedule's availabilities that could recur before end
+
+    :returns: ``None`` if the schedule's occurrences are stored, and should
+        be read instead
+    """
+    availabilities = getattr(schedule, "availabilities", None)
+    if availabilities is None or is_materialized(availabilities.model):
+        return None
+    # a day of leeway covers any time zone
+    return availabilities.filter(start_date__lte=(end + timedelta(days=1)).date())
+
+
+def _expand_block(availability, version: tuple, block_start: datetime) -> tuple:
+    key = version + (block_start,)
+    result = expansion_cache.get(key)
+    if result is None:
+        zone = availability.get_timezone()
+        block_end = block_start + BLOCK
+        span = TimeSpan(block_start.astimezone(zone), block_end.astimezone(zone))
+        result = tuple(
+            TimeSpan(r_start.astimezone(pytz.utc), r_end.astimezone(pytz.utc))
+            for r_start, r_end in availability.get_recurrences(span)
+            if r_start < block_end
+        )
+        expansion_cache.set(key, result)
+    return result
+
+
+def get_occurrences(
+    availabilities: Iterable, start: datetime, end: datetime
+) -> List[TimeSpan]:
+    """
+    Return the occurrences that overlap start-end, sorted by start
+
+    These are the same spans that would be stored as occurrences.
+    """
+    result = []
+    for availability in availabilities:
+        version = (
+            availability._meta.label_lower,
+            availability.pk,
+            tuple(sorted(availability._get_generation_state().items())),
+        )
+        first = start - availability.duration
+        block = EPOCH + ((first - EPOCH) // BLOCK) * BLOCK
+        while block < end:
+            for span in _expand_block(availability, version, block):
+                if span.end > start and span.start < end:
+                    result.append(span)
+            block += BLOCK
+    result.sort(key=lambda x: x.start)
+    return result
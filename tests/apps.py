@@ -1,9 +1,6 @@
 from django.apps import AppConfig
 
-try:
-    from django.test.utils import setup_databases
-except ImportError:  # workaround for django 1.10
-    from django.test.runner import setup_databases
+from django.test.utils import setup_databases
 
 
 class AgendaTestConfig(AppConfig):
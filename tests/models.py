@@ -14,6 +14,7 @@ from django_agenda.models import (
     AbstractAvailabilityOccurrence,
     AbstractTimeSlot,
     AbstractBooking,
+    AbstractBlackout,
 )
 
 
@@ -274,6 +275,11 @@ class Booking(AbstractBooking):
         return "<Booking: {}>".format(self.id)
 
 
+class Blackout(AbstractBlackout):
+    class AgendaMeta:
+        schedule_model = settings.AUTH_USER_MODEL
+
+
 def recreate_time_slots(start=None, end=None):
     """Remove all the time slots and start from scratch
 
@@ -0,0 +1,224 @@
+from datetime import date, time, timedelta
+
+import pytz
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+
+from django_agenda.blackouts import BlackoutCache, blackout_cache, get_blackouts
+from django_agenda.models import (
+    AgendaChange,
+    get_agenda_etag,
+    get_agenda_version,
+    get_free_times,
+    get_slot_grid,
+)
+from django_agenda.time_span import TimeSpan
+from . import models, signals
+from .utils import utc
+
+
+class BlackoutTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        blackout_cache.clear()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.other = User.objects.create(email="other@example.org", username="other")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        for host in (self.host, self.other):
+            availability = models.Availability.objects.create(
+                start_date=date(2010, 1, 4),
+                start_time=time(8),
+                end_time=time(12),
+                recurrence="RRULE:FREQ=DAILY;COUNT=3",
+                schedule=host,
+                timezone=pytz.utc,
+            )
+            availability.recreate_occurrences(utc(2010, 1, 1), utc(2010, 1, 10))
+        self.start = utc(2010, 1, 4)
+        self.end = utc(2010, 1, 7)
+
+    def test_free_times(self):
+        holiday = models.Blackout.objects.create(
+            name="Holiday",
+            start=utc(2010, 1, 5),
+            end=utc(2010, 1, 6),
+            all_schedules=True,
+        )
+        closure = models.Blackout.objects.create(
+            start=utc(2010, 1, 4, 10), end=utc(2010, 1, 4, 11)
+        )
+        closure.schedules.add(self.host)
+        self.assertEqual(
+            [
+                TimeSpan(utc(2010, 1, 4, 8), utc(2010, 1, 4, 10)),
+                TimeSpan(utc(2010, 1, 4, 11), utc(2010, 1, 4, 12)),
+                TimeSpan(utc(2010, 1, 6, 8), utc(2010, 1, 6, 12)),
+            ],
+            get_free_times(self.host, self.start, self.end),
+        )
+        self.assertEqual(
+            [
+                TimeSpan(utc(2010, 1, 4, 8), utc(2010, 1, 4, 12)),
+                TimeSpan(utc(2010, 1, 6, 8), utc(2010, 1, 6, 12)),
+            ],
+            get_free_times(self.other, self.start, self.end),
+        )
+        self.assertEqual(
+            get_free_times(self.host, self.start, self.end),
+            get_free_times(self.host, self.start, self.end, in_database=True),
+        )
+        grid = get_slot_grid(
+            self.host,
+            utc(2010, 1, 4),
+            utc(2010, 1, 5),
+            timedelta(hours=1),
+            timedelta(hours=1),
+            timezone=pytz.utc,
+        )
+        self.assertEqual(
+            [utc(2010, 1, 4, 8), utc(2010, 1, 4, 9), utc(2010, 1, 4, 11)], grid
+        )
+
+        # these are in the past, so they aren't cached
+        with self.assertNumQueries(1):
+            get_blackouts(self.host, self.start, self.end)
+        holiday.delete()
+        closure.schedules.remove(self.host)
+        self.assertEqual(
+            [
+                TimeSpan(utc(2010, 1, 4, 8), utc(2010, 1, 4, 12)),
+                TimeSpan(utc(2010, 1, 5, 8), utc(2010, 1, 5, 12)),
+                TimeSpan(utc(2010, 1, 6, 8), utc(2010, 1, 6, 12)),
+            ],
+            get_free_times(self.host, self.start, self.end),
+        )
+
+    def test_clean(self):
+        models.Blackout.objects.create(
+            start=utc(2010, 1, 5), end=utc(2010, 1, 6), all_schedules=True
+        )
+        booking = models.Booking(
+            guest=self.guest, schedule=self.host, requested_time_1=utc(2010, 1, 5, 9)
+        )
+        with self.assertRaises(ValidationError):
+            booking.full_clean()
+        booking.requested_time_1 = utc(2010, 1, 4, 9)
+        booking.full_clean()
+
+    def test_versions(self):
+        host_etag = get_agenda_etag(self.host)
+        other_version = get_agenda_version(self.other)
+        closure = models.Blackout.objects.create(
+            start=utc(2010, 1, 4, 10), end=utc(2010, 1, 4, 11)
+        )
+        closure.schedules.add(self.host)
+        self.assertNotEqual(host_etag, get_agenda_etag(self.host))
+        self.assertEqual(other_version, get_agenda_version(self.other))
+
+        for change in (
+            lambda: self.other.blackouts.add(closure),
+            lambda: closure.schedules.clear(),
+            lambda: models.Blackout.objects.create(
+                start=utc(2010, 1, 5), end=utc(2010, 1, 6), all_schedules=True
+            ),
+        ):
+            version = get_agenda_version(self.other)
+            change()
+            self.assertGreater(get_agenda_version(self.other), version)
+
+        closure.schedules.add(self.host)
+        version = get_agenda_version(self.host)
+        closure.end = utc(2010, 1, 4, 12)
+        closure.save()
+        self.assertGreater(get_agenda_version(self.host), version)
+        version = get_agenda_version(self.host)
+        closure.delete()
+        self.assertGreater(get_agenda_version(self.host), version)
+
+    @override_settings(AGENDA_CHANGE_FEED=True)
+    def test_changes(self):
+        closure = models.Blackout.objects.create(
+            start=utc(2010, 1, 4, 10), end=utc(2010, 1, 4, 11)
+        )
+        closure.schedules.add(self.host)
+        models.Blackout.objects.create(
+            start=utc(2010, 1, 5), end=utc(2010, 1, 6), all_schedules=True
+        )
+        self.assertEqual(
+            [
+                (str(self.host.pk), utc(2010, 1, 4, 10), utc(2010, 1, 4, 11)),
+                (AgendaChange.ALL_SCHEDULES, utc(2010, 1, 5), utc(2010, 1, 6)),
+            ],
+            [
+                (c.schedule_id, c.start, c.end)
+                for c in AgendaChange.objects.filter(
+                    kind=AgendaChange.BLACKOUT
+                ).order_by("id")
+            ],
+        )
+
+
+class BlackoutCacheTests(TransactionTestCase):
+    def setUp(self):
+        signals.teardown()
+        blackout_cache.clear()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        # upcoming blackouts get cached
+        self.start = now().replace(microsecond=0) + timedelta(days=1)
+
+    def at(self, days):
+        return self.start + timedelta(days=days)
+
+    def test_reload(self):
+        self.assertEqual([], get_blackouts(self.host, self.start, self.at(31)))
+        blackout = models.Blackout.objects.create(start=self.at(4), end=self.at(5))
+        self.host.blackouts.add(blackout)
+        self.assertEqual(
+            [TimeSpan(self.at(4), self.at(5))],
+            get_blackouts(self.host, self.start, self.at(31)),
+        )
+        # cached until something changes
+        with self.assertNumQueries(0):
+            self.assertEqual([], get_blackouts(self.host, self.at(5), self.at(31)))
+        blackout.end = self.at(6)
+        blackout.save()
+        self.assertEqual(
+            [TimeSpan(self.at(4), self.at(6))],
+            get_blackouts(self.host, self.start, self.at(31)),
+        )
+
+    def test_other_process(self):
+        """
+        Changes are seen right away by caches that didn't make them
+        """
+        other = BlackoutCache()
+        self.assertEqual([], other.get(models.Blackout).shared)
+        models.Blackout.objects.create(
+            start=self.at(1), end=self.at(2), all_schedules=True
+        )
+        self.assertEqual(
+            [TimeSpan(self.at(1), self.at(2))], other.get(models.Blackout).shared
+        )
+
+    def test_history(self):
+        """
+        Blackouts that ended a while ago aren't cached, but are still found
+        """
+        old = models.Blackout.objects.create(
+            start=self.at(-10), end=self.at(-9), all_schedules=True
+        )
+        models.Blackout.objects.create(
+            start=self.at(1), end=self.at(2), all_schedules=True
+        )
+        entry = blackout_cache.get(models.Blackout)
+        self.assertEqual([TimeSpan(self.at(1), self.at(2))], entry.shared)
+        self.assertEqual(old.end, entry.past_until)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [TimeSpan(self.at(-10), self.at(-9)), TimeSpan(self.at(1), self.at(2))],
+                get_blackouts(self.host, self.at(-20), self.at(20)),
+            )
+        with self.assertNumQueries(0):
+            get_blackouts(self.host, self.at(-5), self.at(20))
@@ -1,10 +1,12 @@
 from datetime import datetime, time, timedelta
+from unittest import mock
 
 import pytz
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
+from django_agenda.models import BookingQuerySet
 from . import signals, models
 
 
@@ -441,3 +443,214 @@ class AdvancedBookingTests(BaseCase):
             b.full_clean()
             b.save()
         assert list(b.get_requested_times()) == [first_booking_time]
+
+
+class ExpiryTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.start = pytz.utc.localize(datetime(2010, 1, 4, 9))
+
+    def create_booking(self, start, state=models.Booking.STATE_UNCONFIRMED):
+        booking = models.Booking(
+            guest=self.guest, schedule=self.host, requested_time_1=start, state=state
+        )
+        booking.save()
+        return booking
+
+    def test_expire(self):
+        stale = [self.create_booking(self.start + timedelta(days=d)) for d in range(3)]
+        confirmed = self.create_booking(
+            self.start + timedelta(days=4), models.Booking.STATE_CONFIRMED
+        )
+        upcoming = self.create_booking(self.start + timedelta(days=30))
+        self.assertEqual(15, self.host.time_slots.count())
+
+        cutoff = self.start + timedelta(days=10)
+        # two batches of: two selects, two deletes and two updates
+        with self.assertNumQueries(16):
+            count = models.Booking.expire_stale(
+                cutoff,
+                [models.Booking.STATE_UNCONFIRMED],
+                models.Booking.STATE_EXPIRED,
+                batch_size=2,
+            )
+        self.assertEqual(3, count)
+        for booking in stale:
+            booking.refresh_from_db()
+            self.assertEqual(models.Booking.STATE_EXPIRED, booking.state)
+        confirmed.refresh_from_db()
+        self.assertEqual(models.Booking.STATE_CONFIRMED, confirmed.state)
+        upcoming.refresh_from_db()
+        self.assertEqual(models.Booking.STATE_UNCONFIRMED, upcoming.state)
+        # only the slots & padding of the remaining bookings are left
+        self.assertEqual(6, self.host.time_slots.count())
+        self.assertFalse(
+            models.TimeSlot.objects.filter(
+                padding_for__booking__in=[b.id for b in stale]
+            ).exists()
+        )
+
+    def test_confirmed_meanwhile(self):
+        """
+        A booking that gets confirmed after it was picked for expiry is left
+        alone
+        """
+        booking = self.create_booking(self.start)
+        select_for_update = BookingQuerySet.select_for_update
+
+        def confirm_first(queryset, *args, **kwargs):
+            models.Booking.objects.filter(pk=booking.pk).update(
+                state=models.Booking.STATE_CONFIRMED
+            )
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(BookingQuerySet, "select_for_update", confirm_first):
+            count = models.Booking.expire_stale(
+                self.start + timedelta(days=1),
+                [models.Booking.STATE_UNCONFIRMED],
+                models.Booking.STATE_EXPIRED,
+            )
+        self.assertEqual(0, count)
+        booking.refresh_from_db()
+        self.assertEqual(models.Booking.STATE_CONFIRMED, booking.state)
+        self.assertEqual(3, self.host.time_slots.count())
+
+    def test_updated_at(self):
+        booking = self.create_booking(self.start)
+        models.Booking.expire_stale(
+            self.start + timedelta(days=1),
+            [models.Booking.STATE_UNCONFIRMED],
+            models.Booking.STATE_EXPIRED,
+        )
+        updated_at = booking.updated_at
+        booking.refresh_from_db()
+        self.assertGreater(booking.updated_at, updated_at)
+
+
+class TransitionTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.start = pytz.utc.localize(datetime(2010, 1, 4, 9))
+        self.bookings = []
+        for day in range(3):
+            booking = models.Booking(
+                guest=self.guest,
+                schedule=self.host,
+                requested_time_1=self.start + timedelta(days=day),
+                state=models.Booking.STATE_CONFIRMED,
+            )
+            booking.save()
+            self.bookings.append(booking)
+
+    def get_slots(self):
+        return list(
+            self.host.time_slots.order_by("start").values_list(
+                "start", "end", "busy", "booking", "padding_for__booking"
+            )
+        )
+
+    def test_release_and_reserve(self):
+        expected = self.get_slots()
+        self.assertEqual(9, len(expected))
+        queryset = models.Booking.objects.filter(schedule=self.host)
+        self.assertEqual(3, queryset.transition(models.Booking.STATE_CANCELED))
+        self.assertEqual([], self.get_slots())
+        self.assertEqual(
+            {models.Booking.STATE_CANCELED}, {b.state for b in queryset.all()}
+        )
+
+        with self.assertNumQueries(12):
+            queryset.transition(models.Booking.STATE_UNCONFIRMED)
+        self.assertEqual(expected, self.get_slots())
+
+    def test_unchanged(self):
+        slot_ids = set(self.host.time_slots.values_list("id", flat=True))
+        models.Booking.objects.all().transition(models.Booking.STATE_COMPLETED)
+        self.assertEqual(
+            slot_ids, set(self.host.time_slots.values_list("id", flat=True))
+        )
+
+    def test_diffs(self):
+        bookings = models.Booking.objects.filter(schedule=self.host)
+        with self.assertNumQueries(4):
+            diffs = models.Booking.time_slot_diffs(bookings)
+        self.assertEqual({b.pk: ([], []) for b in self.bookings}, diffs)
+
+        with mock.patch.object(models.Booking, "DURATION", timedelta(minutes=90)):
+            diffs = models.Booking.time_slot_diffs(bookings)
+            for booking in self.bookings:
+                add_times, rm_slots = diffs[booking.pk]
+                self.assertEqual(
+                    [
+                        (
+                            booking.requested_time_1,
+                            booking.requested_time_1 + timedelta(minutes=90),
+                        )
+                    ],
+                    [(span.start, span.end) for span in add_times],
+                )
+                self.assertEqual(
+                    [
+                        (
+                            booking.requested_time_1,
+                            booking.requested_time_1 + timedelta(hours=1),
+                        )
+                    ],
+                    [(slot.start, slot.end) for slot in rm_slots],
+                )
+            # nothing changed yet
+            self.assertEqual(9, self.host.time_slots.count())
+
+            models.Booking.time_slot_diffs(bookings, apply=True)
+            self.assertEqual(
+                {b.pk: ([], []) for b in self.bookings},
+                models.Booking.time_slot_diffs(bookings),
+            )
+        first = self.get_slots()[:3]
+        self.assertEqual(
+            [
+                (self.start - timedelta(minutes=30), self.start),
+                (self.start, self.start + timedelta(minutes=90)),
+                (self.start + timedelta(minutes=90), self.start + timedelta(hours=2)),
+            ],
+            [(start, end) for start, end, *_rest in first],
+        )
+
+    def test_slot_bounds(self):
+        canceled = self.bookings[2]
+        canceled.state = models.Booking.STATE_CANCELED
+        canceled.save()
+        with self.assertNumQueries(1):
+            bookings = list(
+                models.Booking.objects.filter(schedule=self.host)
+                .with_slot_bounds()
+                .order_by("pk")
+            )
+        first = bookings[0]
+        self.assertEqual(self.start, first.slot_start)
+        self.assertEqual(self.start + timedelta(hours=1), first.slot_end)
+        self.assertEqual(1, first.slot_count)
+        self.assertEqual(self.start - timedelta(minutes=30), first.padded_start)
+        self.assertEqual(self.start + timedelta(hours=1, minutes=30), first.padded_end)
+        self.assertEqual(self.start + timedelta(days=1), bookings[1].slot_start)
+        self.assertEqual(
+            (None, None, 0, None, None),
+            (
+                bookings[2].slot_start,
+                bookings[2].slot_end,
+                bookings[2].slot_count,
+                bookings[2].padded_start,
+                bookings[2].padded_end,
+            ),
+        )
+
+        models.Booking.objects.filter(pk=first.pk).update(padding=timedelta(0))
+        first.refresh_from_db()
+        first._padding_changed()
+        first = models.Booking.objects.with_slot_bounds().get(pk=first.pk)
+        self.assertEqual(self.start, first.padded_start)
+        self.assertEqual(self.start + timedelta(hours=1), first.padded_end)
@@ -0,0 +1,169 @@
+from datetime import date, time, timedelta
+
+import pytz
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from django_agenda.changes import dirty_ranges, prune_changes, read_changes
+from django_agenda.models import AgendaChange
+from django_agenda.time_span import TimeSpan
+from . import models, signals
+from .utils import utc
+
+
+@override_settings(AGENDA_CHANGE_FEED=True)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            recurrence="RRULE:FREQ=DAILY;COUNT=3",
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        self.availability.recreate_occurrences(utc(2010, 1, 1), utc(2010, 1, 10))
+
+    def get_changes(self, kind=None):
+        queryset = AgendaChange.objects.order_by("id")
+        if kind is not None:
+            queryset = queryset.filter(kind=kind)
+        return [(c.start, c.end) for c in queryset]
+
+    def book(self, start):
+        booking = models.Booking(
+            guest=self.guest, schedule=self.host, requested_time_1=start
+        )
+        booking.save()
+        return booking
+
+    def test_occurrences(self):
+        self.assertEqual(
+            [
+                (utc(2010, 1, 4, 8), utc(2010, 1, 4, 12)),
+                (utc(2010, 1, 5, 8), utc(2010, 1, 5, 12)),
+                (utc(2010, 1, 6, 8), utc(2010, 1, 6, 12)),
+            ],
+            self.get_changes(AgendaChange.AVAILABILITY),
+        )
+        change = AgendaChange.objects.first()
+        self.assertEqual("auth.user", change.schedule_type)
+        self.assertEqual(str(self.host.pk), change.schedule_id)
+
+        # nothing changed
+        AgendaChange.objects.all().delete()
+        self.availability.recreate_occurrences(utc(2010, 1, 1), utc(2010, 1, 10))
+        self.assertEqual([], self.get_changes())
+
+        self.availability.recurrence = "RRULE:FREQ=DAILY;COUNT=2"
+        self.availability.save()
+        self.availability.recreate_occurrences(utc(2010, 1, 1), utc(2010, 1, 10))
+        self.assertEqual(
+            [(utc(2010, 1, 6, 8), utc(2010, 1, 6, 12))], self.get_changes()
+        )
+
+        AgendaChange.objects.all().delete()
+        self.availability.delete()
+        self.assertEqual(
+            [
+                (utc(2010, 1, 4, 8), utc(2010, 1, 4, 12)),
+                (utc(2010, 1, 5, 8), utc(2010, 1, 5, 12)),
+            ],
+            self.get_changes(),
+        )
+
+    def test_bookings(self):
+        AgendaChange.objects.all().delete()
+        booking = self.book(utc(2010, 1, 4, 9))
+        # the padding is included
+        self.assertEqual(
+            [(utc(2010, 1, 4, 8, 30), utc(2010, 1, 4, 10, 30))],
+            self.get_changes(AgendaChange.BOOKING),
+        )
+
+        AgendaChange.objects.all().delete()
+        booking.requested_time_1 = utc(2010, 1, 5, 9)
+        booking.save()
+        self.assertEqual(
+            [
+                (utc(2010, 1, 4, 8, 30), utc(2010, 1, 4, 10, 30)),
+                (utc(2010, 1, 5, 8, 30), utc(2010, 1, 5, 10, 30)),
+            ],
+            self.get_changes(AgendaChange.BOOKING),
+        )
+
+        AgendaChange.objects.all().delete()
+        booking.padding = timedelta(hours=1)
+        booking._padding_changed()
+        self.assertEqual(
+            [
+                (utc(2010, 1, 5, 8), utc(2010, 1, 5, 9)),
+                (utc(2010, 1, 5, 10), utc(2010, 1, 5, 11)),
+            ],
+            self.get_changes(AgendaChange.PADDING),
+        )
+
+        AgendaChange.objects.all().delete()
+        booking.delete()
+        self.assertEqual(
+            [(utc(2010, 1, 5, 8), utc(2010, 1, 5, 11))], self.get_changes()
+        )
+
+    def test_bulk(self):
+        self.book(utc(2010, 1, 4, 9))
+        self.book(utc(2010, 1, 5, 9))
+        AgendaChange.objects.all().delete()
+        models.Booking.objects.all().transition(models.Booking.STATE_CANCELED)
+        self.assertEqual(
+            [
+                (utc(2010, 1, 4, 8, 30), utc(2010, 1, 4, 10, 30)),
+                (utc(2010, 1, 5, 8, 30), utc(2010, 1, 5, 10, 30)),
+            ],
+            self.get_changes(AgendaChange.BOOKING),
+        )
+
+    def test_rollback(self):
+        AgendaChange.objects.all().delete()
+        try:
+            with transaction.atomic():
+                self.book(utc(2010, 1, 4, 9))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual([], self.get_changes())
+
+    @override_settings(AGENDA_CHANGE_FEED=False)
+    def test_disabled(self):
+        AgendaChange.objects.all().delete()
+        self.book(utc(2010, 1, 4, 9))
+        self.assertEqual([], self.get_changes())
+
+    def test_consumer(self):
+        self.book(utc(2010, 1, 4, 9))
+        batch = read_changes(size=2)
+        self.assertEqual(2, len(batch.changes))
+        batch = read_changes(after=batch.cursor, size=2)
+        self.assertEqual(2, len(batch.changes))
+        cursor = batch.cursor
+        batch = read_changes(after=cursor, size=2)
+        self.assertEqual([], batch.changes)
+        self.assertEqual(cursor, batch.cursor)
+
+        ranges = dirty_ranges(read_changes().changes)
+        self.assertEqual(
+            {
+                ("auth.user", str(self.host.pk)): [
+                    TimeSpan(utc(2010, 1, 4, 8), utc(2010, 1, 4, 12)),
+                    TimeSpan(utc(2010, 1, 5, 8), utc(2010, 1, 5, 12)),
+                    TimeSpan(utc(2010, 1, 6, 8), utc(2010, 1, 6, 12)),
+                ]
+            },
+            ranges,
+        )
+
+        self.assertEqual(4, prune_changes(cursor))
+        self.assertEqual([], read_changes().changes)
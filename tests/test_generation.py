@@ -1,4 +1,5 @@
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
 import pytz
 from django.contrib.auth.models import User
@@ -85,6 +86,36 @@ class GenerationTestCase(TestCase):
         self.assertEqual(
             [span_1, span_2], get_free_times(self.host, span.start, span.end))
 
+    def test_chunked(self):
+        """
+        Long horizons get generated a week at a time here, and end up the
+        same as generating everything at once
+        """
+        obj = models.Availability.objects.create(
+            start_date=date(2003, 1, 1),
+            start_time=time(9),
+            end_time=time(17),
+            recurrence='RRULE:FREQ=DAILY',
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        start = pytz.utc.localize(datetime(2003, 1, 1))
+        end = pytz.utc.localize(datetime(2004, 1, 1))
+        occurrences = models.AvailabilityOccurrence.objects.filter(
+            availability=obj).order_by('start')
+        with mock.patch('django_agenda.models.GENERATION_CHUNK',
+                        timedelta(days=7)):
+            obj.recreate_occurrences(start, end)
+            self.assertEqual(365, occurrences.count())
+            obj.recurrence = 'RRULE:FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR'
+            obj.save()
+            obj.recreate_occurrences(start, end)
+            chunked = [(o.start, o.end) for o in occurrences]
+        self.assertEqual(261, len(chunked))
+        occurrences.delete()
+        obj.recreate_occurrences(start, end)
+        self.assertEqual(chunked, [(o.start, o.end) for o in occurrences])
+
 
 class GenerationBusyTestCase(TestCase):
 
@@ -168,3 +199,65 @@ class GenerationBusyTestCase(TestCase):
         spans = [TimeSpan(self.span.start, self.span.end)]
         self.assertEqual(
             spans, get_free_times(self.host, self.span.start, self.span.end))
+
+
+class DatabaseFreeTimesTestCase(TestCase):
+
+    def setUp(self):
+        signals.setup()
+        self.host = create_host()
+        self.span = TimeSpan(pytz.utc.localize(datetime(2002, 1, 7)),
+                             pytz.utc.localize(datetime(2002, 1, 14)))
+        for start_hour, end_hour in ((8, 12), (11, 14), (14, 16), (20, 22)):
+            obj = models.Availability.objects.create(
+                start_date=self.span.start.date(),
+                start_time=time(start_hour),
+                end_time=time(end_hour),
+                recurrence='RRULE:FREQ=DAILY',
+                schedule=self.host,
+                timezone=pytz.utc,
+            )
+            obj.recreate_occurrences(self.span.start, self.span.end)
+        busy_times = (
+            ((8, 6), (9, 10)),  # before the first occurrence
+            ((8, 10), (8, 11)),  # overlaps two occurrences
+            ((8, 11, 30), (8, 12, 30)),
+            ((8, 12), (8, 13)),  # overlaps another busy slot
+            ((9, 13), (9, 21)),  # spans a gap
+            ((10, 8), (10, 22)),  # covers a whole day
+        )
+        for b_start, b_end in busy_times:
+            models.TimeSlot.objects.create(
+                start=pytz.utc.localize(datetime(2002, 1, *b_start)),
+                end=pytz.utc.localize(datetime(2002, 1, *b_end)),
+                busy=True,
+                schedule=self.host)
+
+    def test_same_as_python(self):
+        for days in range(7):
+            for hours in (0, 9, 13):
+                start = self.span.start + timedelta(days=days, hours=hours)
+                end = start + timedelta(days=1, hours=hours)
+                self.assertEqual(
+                    get_free_times(self.host, start, end),
+                    get_free_times(self.host, start, end, in_database=True))
+
+    def test_covered(self):
+        """
+        A busy slot that covers a whole free span removes it
+        """
+        start = pytz.utc.localize(datetime(2002, 1, 10))
+        end = start + timedelta(days=1)
+        self.assertEqual([], get_free_times(self.host, start, end))
+        self.assertEqual(
+            [], get_free_times(self.host, start, end, in_database=True))
+
+    def test_fallback(self):
+        path = 'django_agenda.models.supports_window_functions'
+        with mock.patch(path, return_value=False), \
+                mock.patch('django_agenda.models.get_free_times_sql') as sql:
+            spans = get_free_times(
+                self.host, self.span.start, self.span.end, in_database=True)
+        sql.assert_not_called()
+        self.assertEqual(
+            spans, get_free_times(self.host, self.span.start, self.span.end))
@@ -0,0 +1,126 @@
+from datetime import datetime, time, timedelta
+
+import pytz
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+from django.utils.http import http_date
+
+from django_agenda import ical
+from . import models, signals
+
+
+class ICalExportTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.start = pytz.utc.localize(datetime(2010, 1, 4))
+        self.end = self.start + timedelta(days=2)
+        availability = models.Availability.objects.create(
+            start_date=self.start.date(),
+            start_time=time(8),
+            end_time=time(12),
+            recurrence="RRULE:FREQ=DAILY",
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        availability.recreate_occurrences(self.start, self.end)
+        self.booking = models.Booking.objects.create(
+            guest=self.guest,
+            schedule=self.host,
+            requested_time_1=self.start + timedelta(hours=9),
+        )
+
+    def get_lines(self, component):
+        text = "".join(ical.iter_ics(self.host, self.start, self.end, component))
+        self.assertTrue(text.endswith("\r\n"))
+        return text.split("\r\n")
+
+    def test_freebusy(self):
+        lines = self.get_lines(ical.VFREEBUSY)
+        self.assertEqual("BEGIN:VCALENDAR", lines[0])
+        self.assertEqual(
+            [
+                "FREEBUSY;FBTYPE=FREE:20100104T080000Z/20100104T083000Z",
+                "FREEBUSY;FBTYPE=FREE:20100104T103000Z/20100104T120000Z",
+                "FREEBUSY;FBTYPE=FREE:20100105T080000Z/20100105T120000Z",
+                "FREEBUSY;FBTYPE=BUSY:20100104T083000Z/20100104T090000Z",
+                "FREEBUSY;FBTYPE=BUSY:20100104T090000Z/20100104T100000Z",
+                "FREEBUSY;FBTYPE=BUSY:20100104T100000Z/20100104T103000Z",
+            ],
+            [line for line in lines if line.startswith("FREEBUSY")],
+        )
+
+    def test_events(self):
+        lines = self.get_lines(ical.VEVENT)
+        self.assertEqual(6, lines.count("BEGIN:VEVENT"))
+        self.assertEqual(3, lines.count("SUMMARY:Available"))
+        self.assertEqual(3, lines.count("SUMMARY:Busy"))
+
+    def test_clamped(self):
+        start = self.start + timedelta(hours=9, minutes=30)
+        text = "".join(ical.iter_ics(self.host, start, self.end, ical.VEVENT))
+        lines = text.split("\r\n")
+        self.assertEqual(
+            [
+                # free
+                "DTSTART:20100104T103000Z",
+                "DTSTART:20100105T080000Z",
+                # busy
+                "DTSTART:20100104T093000Z",
+                "DTSTART:20100104T100000Z",
+            ],
+            [line for line in lines if line.startswith("DTSTART")],
+        )
+
+    def test_conditional(self):
+        last_modified = ical.get_last_modified(self.host)
+        self.assertIsNotNone(last_modified)
+        factory = RequestFactory()
+        response = ical.ics_response(
+            factory.get("/"), self.host, self.start, self.end
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b"BEGIN:VFREEBUSY", b"".join(response.streaming_content))
+
+        request = factory.get(
+            "/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        with self.assertNumQueries(1):
+            response = ical.ics_response(request, self.host, self.start, self.end)
+        self.assertEqual(304, response.status_code)
+
+        request = factory.get(
+            "/",
+            HTTP_IF_MODIFIED_SINCE=http_date(
+                (last_modified - timedelta(days=1)).timestamp()
+            ),
+        )
+        response = ical.ics_response(request, self.host, self.start, self.end)
+        self.assertEqual(200, response.status_code)
+
+    def test_etag(self):
+        factory = RequestFactory()
+        response = ical.ics_response(factory.get("/"), self.host, self.start, self.end)
+        etag = response["ETag"]
+        self.assertEqual(ical.get_agenda_etag(self.host), etag)
+
+        request = factory.get("/", HTTP_IF_NONE_MATCH=etag)
+        with self.assertNumQueries(1):
+            response = ical.ics_response(request, self.host, self.start, self.end)
+        self.assertEqual(304, response.status_code)
+
+        # changing the schedule changes the version
+        self.booking.requested_time_1 += timedelta(hours=1)
+        self.booking.save()
+        response = ical.ics_response(request, self.host, self.start, self.end)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_deleted(self):
+        """
+        Deleting a booking changes the last modified time
+        """
+        last_modified = ical.get_last_modified(self.host)
+        self.booking.delete()
+        self.assertGreater(ical.get_last_modified(self.host), last_modified)
@@ -0,0 +1,89 @@
+from datetime import date, datetime, time
+from unittest import mock
+
+import pytz
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from django_agenda import ical
+from . import models, signals
+
+ICS = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//Example//EN
+BEGIN:VEVENT
+UID:1@example.org
+DTSTART;TZID=America/Vancouver:20200106T080000
+DTEND;TZID=America/Vancouver:20200106T120000
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE
+EXDATE;TZID=America/Vancouver:20200108T080000
+SUMMARY:Morning clinic
+END:VEVENT
+BEGIN:VEVENT
+UID:2@example.org
+DTSTART:20200107T200000Z
+DURATION:PT2H
+RRULE:FREQ=DAILY;
+ UNTIL=20200109T200000Z
+END:VEVENT
+BEGIN:VEVENT
+UID:3@example.org
+DTSTART;VALUE=DATE:20200110
+SUMMARY:Holiday
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        signals.setup()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.timezone = pytz.timezone("America/Vancouver")
+
+    def test_parse(self):
+        items = list(ical.parse_ics(ICS))
+        self.assertEqual(2, len(items))
+        clinic, evening = items
+        self.assertEqual(date(2020, 1, 6), clinic["start_date"])
+        self.assertEqual(time(8), clinic["start_time"])
+        self.assertEqual(time(12), clinic["end_time"])
+        self.assertEqual("America/Vancouver", str(clinic["timezone"]))
+        self.assertEqual([datetime(2020, 1, 8, 8)], clinic["recurrence"].exdates)
+        self.assertEqual(time(22), evening["end_time"])
+        self.assertEqual(pytz.utc, evening["timezone"])
+        self.assertEqual(
+            datetime(2020, 1, 9, 20), evening["recurrence"].rrules[0].until
+        )
+
+    def test_import(self):
+        start = self.timezone.localize(datetime(2020, 1, 1))
+        end = self.timezone.localize(datetime(2020, 1, 15))
+        path = "tests.models.Availability.recreate_occurrences"
+        with mock.patch(path) as recreate:
+            result = models.Availability.bulk_import(
+                self.host, ical.parse_ics(ICS), start, end
+            )
+        # the signal doesn't fire
+        recreate.assert_not_called()
+        self.assertEqual(2, len(result.availabilities))
+        self.assertTrue(all(a.pk for a in result.availabilities))
+        self.assertEqual(
+            {a.pk: a.created_at for a in result.availabilities},
+            dict(models.Availability.objects.values_list("pk", "created_at")),
+        )
+        # Mondays & Wednesdays without the 8th, plus 3 evenings
+        self.assertEqual(5, result.occurrence_count)
+        self.assertGreater(result.rows_per_second, 0)
+        occurrences = models.AvailabilityOccurrence.objects.filter(
+            schedule=self.host
+        ).order_by("start")
+        self.assertEqual(5, len(occurrences))
+        self.assertEqual(
+            [6, 7, 8, 9, 13],
+            [o.start.astimezone(self.timezone).day for o in occurrences],
+        )
+        # a reloaded availability generates the same occurrences
+        availability = models.Availability.objects.get(pk=result.availabilities[0].pk)
+        availability.recreate_occurrences(start, end)
+        self.assertEqual(5, occurrences.count())
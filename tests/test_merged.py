@@ -0,0 +1,156 @@
+from datetime import date, time, timedelta
+from unittest import mock
+
+import pytz
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from django_agenda.models import (
+    MergedOccurrence,
+    get_agenda_version,
+    get_free_times,
+    merge_all_occurrences,
+)
+from django_agenda.time_span import TimeSpan
+from . import models, signals
+from .utils import utc
+
+
+def merge_mode():
+    return mock.patch.object(
+        models.Availability.AgendaMeta, "merge_occurrences", True, create=True
+    )
+
+
+class MergedOccurrenceTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.start = utc(2010, 1, 4)
+        self.end = utc(2010, 1, 6)
+        self.availabilities = [
+            models.Availability.objects.create(
+                start_date=date(2010, 1, 4),
+                start_time=start_time,
+                end_time=end_time,
+                recurrence="RRULE:FREQ=DAILY;COUNT=2",
+                schedule=self.host,
+                timezone=pytz.utc,
+            )
+            for start_time, end_time in (
+                (time(8), time(10)),
+                (time(9, 30), time(12)),
+                (time(12), time(14)),
+            )
+        ]
+
+    def generate(self):
+        for availability in self.availabilities:
+            availability.recreate_occurrences(self.start, self.end)
+
+    def get_merged(self):
+        return [
+            (m.start, m.end, sorted(int(s.availability_id) for s in m.sources.all()))
+            for m in MergedOccurrence.objects.order_by("start")
+        ]
+
+    def test_merged(self):
+        ids = sorted(a.pk for a in self.availabilities)
+        with merge_mode():
+            self.generate()
+            self.assertEqual(
+                [
+                    (utc(2010, 1, 4, 8), utc(2010, 1, 4, 14), ids),
+                    (utc(2010, 1, 5, 8), utc(2010, 1, 5, 14), ids),
+                ],
+                self.get_merged(),
+            )
+            free_times = get_free_times(self.host, self.start, self.end)
+            self.assertEqual(
+                get_free_times(self.host, self.start, self.end, in_database=True),
+                free_times,
+            )
+        self.assertEqual(free_times, get_free_times(self.host, self.start, self.end))
+
+    def test_split_in_two(self):
+        first, second, third = self.availabilities
+        with merge_mode():
+            self.generate()
+            second.delete()
+            self.assertEqual(
+                [
+                    (utc(2010, 1, 4, 8), utc(2010, 1, 4, 10), [first.pk]),
+                    (utc(2010, 1, 4, 12), utc(2010, 1, 4, 14), [third.pk]),
+                    (utc(2010, 1, 5, 8), utc(2010, 1, 5, 10), [first.pk]),
+                    (utc(2010, 1, 5, 12), utc(2010, 1, 5, 14), [third.pk]),
+                ],
+                self.get_merged(),
+            )
+
+            # joined back up again
+            third.start_time = time(10)
+            third.save()
+            third.recreate_occurrences(self.start, self.end)
+            self.assertEqual(
+                [
+                    (utc(2010, 1, 4, 8), utc(2010, 1, 4, 14), [first.pk, third.pk]),
+                    (utc(2010, 1, 5, 8), utc(2010, 1, 5, 14), [first.pk, third.pk]),
+                ],
+                self.get_merged(),
+            )
+            self.assertEqual(
+                [
+                    TimeSpan(utc(2010, 1, 4, 8), utc(2010, 1, 4, 14)),
+                    TimeSpan(utc(2010, 1, 5, 8), utc(2010, 1, 5, 14)),
+                ],
+                get_free_times(self.host, self.start, self.end),
+            )
+
+    def test_clean(self):
+        with merge_mode():
+            self.generate()
+            booking = models.Booking(
+                guest=self.guest,
+                schedule=self.host,
+                requested_time_1=utc(2010, 1, 4, 9, 15),
+            )
+            booking.full_clean()
+            booking.requested_time_1 = utc(2010, 1, 4, 13, 30)
+            with self.assertRaises(ValidationError):
+                booking.full_clean()
+
+    def test_extend(self):
+        with merge_mode():
+            self.generate()
+            for availability in self.availabilities:
+                availability.recurrence = "RRULE:FREQ=DAILY"
+                availability.save()
+                availability.recreate_occurrences(self.start, self.end)
+            end = self.end + timedelta(days=40)
+            free_times = get_free_times(self.host, self.start, end)
+            self.assertEqual(42, len(free_times))
+            self.assertEqual(42, MergedOccurrence.objects.filter(start__lt=end).count())
+
+    def test_merge_all(self):
+        # generated before merging got turned on
+        self.generate()
+        free_times = get_free_times(self.host, self.start, self.end)
+        version = get_agenda_version(self.host)
+        with merge_mode():
+            self.assertEqual([], get_free_times(self.host, self.start, self.end))
+            self.assertEqual(1, merge_all_occurrences(models.Availability))
+            self.assertEqual(
+                free_times, get_free_times(self.host, self.start, self.end)
+            )
+            self.assertGreater(get_agenda_version(self.host), version)
+            merged = self.get_merged()
+            self.assertEqual(2, len(merged))
+            # running it again doesn't change anything
+            self.assertEqual(1, merge_all_occurrences(models.Availability))
+            self.assertEqual(merged, self.get_merged())
+
+    def test_merge_all_disabled(self):
+        with self.assertRaises(RuntimeError):
+            merge_all_occurrences(models.Availability)
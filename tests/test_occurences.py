@@ -1,10 +1,19 @@
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
 import pytz
 from django.contrib.auth.models import User
 from django.test import TestCase
 
-from . import models
+from django_agenda.models import (
+    ScheduleVersion,
+    extend_occurrences,
+    get_agenda_etag,
+    get_agenda_version,
+    get_free_times,
+)
+from django_agenda.time_span import TimeSpan
+from . import models, signals
 
 
 def create_host():
@@ -71,3 +80,235 @@ class OccurrenceUnitTests(TestCase):
         self.assertEqual(datetime(2018, 10, 30, 22, tzinfo=pytz.utc), all_slots[0].end)
         self.assertEqual(datetime(2018, 11, 6, 16, tzinfo=pytz.utc), all_slots[1].start)
         self.assertEqual(datetime(2018, 11, 6, 23, tzinfo=pytz.utc), all_slots[1].end)
+
+
+class PartialRegenerationTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = create_host()
+        self.timezone = pytz.timezone("America/Vancouver")
+        self.start = self.timezone.localize(datetime(2001, 1, 1))
+        self.end = self.timezone.localize(datetime(2001, 1, 11))
+        availability = models.Availability.objects.create(
+            start_date=date(2001, 1, 1),
+            start_time=time(8),
+            end_time=time(15),
+            recurrence="RRULE:FREQ=DAILY",
+            schedule=self.host,
+            timezone=self.timezone,
+        )
+        availability.recreate_occurrences(self.start, self.end)
+        self.availability = models.Availability.objects.get(id=availability.id)
+        self.assertEqual(self.availability.occurrences.count(), 10)
+
+    def recreate(self):
+        """
+        Recreate the occurrences and return the spans that were synced
+        """
+        availability = self.availability
+        with mock.patch.object(
+            models.Availability,
+            "_sync_occurrences",
+            autospec=True,
+            side_effect=models.Availability._sync_occurrences,
+        ) as sync:
+            availability.recreate_occurrences(self.start, self.end)
+        return [c[0][1] for c in sync.call_args_list]
+
+    def test_exclusion(self):
+        self.availability.recurrence = "RRULE:FREQ=DAILY\nEXDATE:20010105T140000Z"
+        self.availability.save()
+        spans = self.recreate()
+        excluded = self.timezone.localize(datetime(2001, 1, 5, 8))
+        self.assertEqual([TimeSpan(excluded, excluded)], spans)
+        self.assertEqual(self.availability.occurrences.count(), 9)
+        self.assertFalse(self.availability.occurrences.filter(start=excluded).exists())
+
+        # and back again
+        self.availability.recurrence = "RRULE:FREQ=DAILY"
+        self.availability.save()
+        self.assertEqual(1, len(self.recreate()))
+        self.assertEqual(self.availability.occurrences.count(), 10)
+
+    def test_same_as_full(self):
+        """
+        Partial regeneration leaves the same occurrences as a full one
+        """
+        self.start += timedelta(days=2)
+        self.availability.recurrence = "RRULE:FREQ=DAILY\nEXDATE:20010105T160000Z"
+        self.availability.save()
+        self.recreate()
+        partial = list(self.availability.occurrences.order_by("start").spans())
+        self.availability.occurrences.all().delete()
+        self.recreate()
+        self.assertEqual(
+            partial, list(self.availability.occurrences.order_by("start").spans())
+        )
+        self.assertEqual(8, len(partial))
+
+    def test_longer(self):
+        """
+        Dates past what was generated before get generated too
+        """
+        self.end += timedelta(days=10)
+        self.availability.recurrence = "RRULE:FREQ=DAILY\nEXDATE:20010105T140000Z"
+        self.availability.save()
+        spans = self.recreate()
+        self.assertIn(TimeSpan(self.end - timedelta(days=10), self.end), spans)
+        self.assertEqual(19, self.availability.occurrences.count())
+        day = self.timezone.localize(datetime(2001, 1, 20))
+        self.assertEqual(
+            [
+                TimeSpan(
+                    self.timezone.localize(datetime(2001, 1, 20, 8)),
+                    self.timezone.localize(datetime(2001, 1, 20, 15)),
+                )
+            ],
+            get_free_times(self.host, day, day + timedelta(days=1)),
+        )
+
+    def test_unknown_horizon(self):
+        """
+        Without a horizon, everything gets regenerated
+        """
+        # like after upgrading
+        ScheduleVersion.objects.all().delete()
+        self.start += timedelta(days=5)
+        self.end += timedelta(days=20)
+        self.availability.recurrence = "RRULE:FREQ=DAILY\nEXDATE:20010110T140000Z"
+        self.availability.save()
+        spans = self.recreate()
+        self.assertEqual([TimeSpan(self.start, self.end)], spans)
+        self.assertEqual(24, self.availability.occurrences.count())
+
+    def test_truncation(self):
+        self.availability.recurrence = "RRULE:FREQ=DAILY;UNTIL=20010104T140000Z"
+        self.availability.save()
+        spans = self.recreate()
+        self.assertEqual(1, len(spans))
+        self.assertEqual(self.end, spans[0].end)
+        self.assertEqual(self.availability.occurrences.count(), 4)
+
+    def test_time_change(self):
+        self.availability.end_time = time(16)
+        self.availability.save()
+        spans = self.recreate()
+        self.assertEqual([TimeSpan(self.start, self.end)], spans)
+        self.assertEqual(self.availability.occurrences.count(), 10)
+        for occurrence in self.availability.occurrences.all():
+            self.assertEqual(time(16), occurrence.end.astimezone(self.timezone).time())
+
+
+class SpansTests(TestCase):
+    def test_spans(self):
+        host = create_host()
+        availability = models.Availability.objects.create(
+            start_date=date(2001, 1, 1),
+            start_time=time(8),
+            end_time=time(15),
+            recurrence="RRULE:FREQ=DAILY",
+            schedule=host,
+            timezone=pytz.utc,
+        )
+        start = pytz.utc.localize(datetime(2001, 1, 1))
+        end = pytz.utc.localize(datetime(2001, 1, 3))
+        availability.recreate_occurrences(start, end)
+        spans = list(host.availability_occurrences.order_by("start").spans())
+        self.assertEqual(2, len(spans))
+        self.assertEqual(
+            (
+                pytz.utc.localize(datetime(2001, 1, 1, 8)),
+                pytz.utc.localize(datetime(2001, 1, 1, 15)),
+            ),
+            tuple(spans[0]),
+        )
+        self.assertEqual(spans[1].start, pytz.utc.localize(datetime(2001, 1, 2, 8)))
+        merged = list(TimeSpan.merge_sorted_spans(spans))
+        self.assertEqual(2, len(merged))
+
+
+class AgendaVersionTests(TestCase):
+    def test_version(self):
+        host = create_host()
+        self.assertEqual(0, get_agenda_version(host))
+        availability = models.Availability.objects.create(
+            start_date=date(2001, 1, 1),
+            start_time=time(8),
+            end_time=time(15),
+            schedule=host,
+            timezone=pytz.utc,
+        )
+        start = pytz.utc.localize(datetime(2001, 1, 1))
+        end = pytz.utc.localize(datetime(2001, 1, 3))
+        availability.recreate_occurrences(start, end)
+        self.assertEqual(1, get_agenda_version(host))
+        availability.recreate_occurrences(start, end)
+        with self.assertNumQueries(1):
+            self.assertEqual(2, get_agenda_version(host))
+        self.assertEqual('"agenda-2"', get_agenda_etag(host))
+
+    def test_booking(self):
+        """
+        Only saving a booking that changes its time slots changes the version
+        """
+        host = create_host()
+        guest = User.objects.create(email="guest@example.org", username="guest")
+        booking = models.Booking(
+            guest=guest,
+            schedule=host,
+            requested_time_1=pytz.utc.localize(datetime(2001, 1, 1, 9)),
+        )
+        with booking.set_editor(host):
+            booking.save()
+            self.assertEqual(1, get_agenda_version(host))
+            booking.assignee = host
+            booking.save()
+            self.assertEqual(1, get_agenda_version(host))
+            booking.requested_time_1 += timedelta(hours=1)
+            booking.save()
+            self.assertEqual(2, get_agenda_version(host))
+
+
+class HorizonTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = create_host()
+        self.availability = models.Availability.objects.create(
+            start_date=date(2001, 1, 1),
+            start_time=time(8),
+            end_time=time(15),
+            recurrence="RRULE:FREQ=WEEKLY",
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        self.start = pytz.utc.localize(datetime(2001, 1, 1))
+        self.availability.recreate_occurrences(
+            self.start, self.start + timedelta(days=14)
+        )
+
+    def test_extend(self):
+        start = self.start + timedelta(days=70)
+        end = start + timedelta(days=7)
+        self.assertEqual(1, len(get_free_times(self.host, start, end)))
+        self.assertEqual(
+            start + timedelta(hours=8),
+            self.host.availability_occurrences.latest("start").start,
+        )
+        # there are no gaps, and nothing was generated twice
+        self.assertEqual(11, self.host.availability_occurrences.count())
+        # the horizon, occurrences & busy slots
+        with self.assertNumQueries(3):
+            get_free_times(self.host, start, end)
+
+    def test_regenerate(self):
+        """
+        Regenerating a shorter window moves the tracked end back
+        """
+        end = self.start + timedelta(days=70)
+        extend_occurrences(self.host, end)
+        self.availability.recreate_occurrences(
+            self.start, self.start + timedelta(days=14)
+        )
+        self.assertEqual(2, self.host.availability_occurrences.count())
+        free_times = get_free_times(self.host, end, end + timedelta(days=1))
+        self.assertEqual(1, len(free_times))
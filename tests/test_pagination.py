@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytz
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from . import models, signals
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.start = pytz.utc.localize(datetime(2010, 1, 4, 9))
+        self.bookings = []
+        for day in range(5):
+            booking = models.Booking(
+                guest=self.guest,
+                schedule=self.host,
+                requested_time_1=self.start + timedelta(days=day),
+            )
+            booking.save()
+            self.bookings.append(booking)
+
+    def test_time_slots(self):
+        # 5 bookings with 2 padding slots each
+        seen = []
+        cursor = None
+        while True:
+            page = self.host.time_slots.page(after=cursor, size=4)
+            seen.extend(page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(15, len(seen))
+        self.assertEqual(15, len({slot.id for slot in seen}))
+        starts = [slot.start for slot in seen]
+        self.assertEqual(sorted(starts), starts)
+
+    def test_exclude_padding(self):
+        page = self.host.time_slots.page(
+            size=2, start=self.start + timedelta(days=1), exclude_padding=True
+        )
+        self.assertEqual(
+            [self.bookings[1].id, self.bookings[2].id],
+            [slot.booking_id for slot in page.items],
+        )
+        page = self.host.time_slots.page(
+            after=page.next_cursor, size=2, exclude_padding=True
+        )
+        self.assertEqual(
+            [self.bookings[3].id, self.bookings[4].id],
+            [slot.booking_id for slot in page.items],
+        )
+
+    def test_same_start(self):
+        """
+        Time slots that start at the same time aren't skipped
+        """
+        page = self.host.time_slots.page(size=1, exclude_padding=True)
+        # a second slot at the same time as the first
+        models.TimeSlot.objects.create(
+            schedule=self.host, start=self.start, end=self.start + timedelta(hours=1)
+        )
+        page = self.host.time_slots.page(
+            after=page.next_cursor, size=1, exclude_padding=True
+        )
+        self.assertEqual(self.start, page.items[0].start)
+        self.assertIsNone(page.items[0].booking_id)
+
+    def test_bookings(self):
+        self.bookings[2].state = models.Booking.STATE_CANCELED
+        self.bookings[2].save()
+        queryset = models.Booking.objects.filter(
+            state__in=models.Booking.RESERVED_STATES
+        )
+        page = queryset.page(self.host, size=3)
+        self.assertEqual(
+            [self.bookings[0], self.bookings[1], self.bookings[3]], page.items
+        )
+        page = queryset.page(self.host, after=page.next_cursor, size=3)
+        self.assertEqual([self.bookings[4]], page.items)
+        self.assertIsNone(page.next_cursor)
+
+    def test_booking_once(self):
+        """
+        Bookings with several time slots only show up once
+        """
+        models.TimeSlot.objects.create(
+            schedule=self.host,
+            booking=self.bookings[0],
+            start=self.start + timedelta(days=1, hours=2),
+            end=self.start + timedelta(days=1, hours=3),
+        )
+        bookings = []
+        cursor = None
+        while True:
+            page = models.Booking.objects.page(self.host, after=cursor, size=2)
+            bookings.extend(page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(self.bookings, bookings)
+
+    def test_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, models.TimeSlot._meta.db_table
+            )
+        columns = [c["columns"] for c in constraints.values() if c["index"]]
+        self.assertIn(["schedule_id", "padding_for_id", "start", "id"], columns)
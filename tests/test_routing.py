@@ -0,0 +1,206 @@
+import contextlib
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+import pytz
+from django.apps.registry import Apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.utils import ConnectionDoesNotExist
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from django_agenda import routing
+from django_agenda.blackouts import blackout_cache
+from django_agenda.models import get_agenda_version, get_free_times
+from . import models, signals
+
+
+def proxy_model():
+    """
+    Make a proxy of the schedule model, without registering it
+    """
+
+    class Host(User):
+        class Meta:
+            apps = Apps()
+            proxy = True
+
+    return Host
+
+
+@override_settings(AGENDA_READ_DATABASE="replica", AGENDA_STALENESS_WINDOW=60)
+class RoutingTests(TransactionTestCase):
+    def setUp(self):
+        signals.teardown()
+        cache.clear()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+
+    def test_replica(self):
+        self.assertEqual("replica", routing.get_read_database(self.host))
+        with override_settings(AGENDA_READ_DATABASE=None):
+            self.assertIsNone(routing.get_read_database(self.host))
+
+    def test_recent_write(self):
+        """
+        After a booking is saved, reads for that schedule use the primary
+        """
+        start = pytz.utc.localize(datetime(2010, 1, 4, 9))
+        booking = models.Booking(
+            guest=self.guest, schedule=self.host, requested_time_1=start
+        )
+        with booking.set_editor(self.host):
+            booking.full_clean()
+            booking.save()
+        self.assertEqual("default", routing.get_read_database(self.host))
+        host = proxy_model().objects.get(pk=self.host.pk)
+        self.assertEqual("default", routing.get_read_database(host))
+        # other schedules aren't affected
+        self.assertEqual("replica", routing.get_read_database(self.guest))
+
+    def test_free_times_routing(self):
+        availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        start = pytz.utc.localize(datetime(2010, 1, 4))
+        end = start + timedelta(days=1)
+        availability.recreate_occurrences(start, end)
+        path = "django_agenda.models.get_read_database"
+        with mock.patch(path, return_value="default") as get_read_database:
+            spans = get_free_times(self.host, start, end)
+        get_read_database.assert_called_once()
+        self.assertEqual(1, len(spans))
+        # the occurrences were just written, so the primary gets used
+        self.assertEqual("default", routing.get_read_database(self.host))
+
+    def test_blackouts_routing(self):
+        """
+        Blackouts are read from the database that the rest is read from
+        """
+        availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        start = pytz.utc.localize(datetime(2010, 1, 4))
+        end = start + timedelta(days=1)
+        availability.recreate_occurrences(start, end)
+        # forget the recent write, so reads would go to the (missing) replica
+        cache.clear()
+        blackout_cache.clear()
+        spans = get_free_times(self.host, start, end, using="default")
+        self.assertEqual(1, len(spans))
+        booking = models.Booking(
+            guest=self.guest,
+            schedule=self.host,
+            requested_time_1=start + timedelta(hours=9),
+        )
+        with booking.set_editor(self.host):
+            booking.full_clean()
+
+
+@contextlib.contextmanager
+def sharded(resolver):
+    """
+    Give all the test models a shard resolver
+    """
+    with contextlib.ExitStack() as stack:
+        for model in (
+            models.Availability,
+            models.AvailabilityOccurrence,
+            models.TimeSlot,
+            models.Booking,
+        ):
+            stack.enter_context(
+                mock.patch.object(
+                    model.AgendaMeta, "shard_resolver", resolver, create=True
+                )
+            )
+        yield
+
+
+class ShardingTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        self.start = pytz.utc.localize(datetime(2010, 1, 4))
+        self.end = self.start + timedelta(days=1)
+
+    def test_resolver(self):
+        resolver = mock.Mock(return_value="default")
+        with sharded(resolver):
+            self.availability.recreate_occurrences(self.start, self.end)
+            resolver.assert_called_with(User, self.host.pk)
+            resolver.reset_mock()
+            booking = models.Booking(
+                guest=self.guest,
+                schedule=self.host,
+                requested_time_1=self.start + timedelta(hours=9),
+            )
+            with booking.set_editor(self.host):
+                booking.full_clean()
+                booking.save()
+            resolver.assert_called_with(User, self.host.pk)
+            self.assertEqual(2, len(get_free_times(self.host, self.start, self.end)))
+        self.assertEqual(3, self.host.time_slots.count())
+
+    def test_missing_shard(self):
+        """
+        Nothing should fall back to the default database
+        """
+        with sharded(mock.Mock(return_value="missing")):
+            with self.assertRaises(ConnectionDoesNotExist):
+                self.availability.recreate_occurrences(self.start, self.end)
+            with self.assertRaises(ConnectionDoesNotExist):
+                get_free_times(self.host, self.start, self.end)
+            booking = models.Booking(
+                guest=self.guest,
+                schedule=self.host,
+                requested_time_1=self.start + timedelta(hours=9),
+            )
+            with self.assertRaises(ConnectionDoesNotExist):
+                booking.save()
+        self.assertFalse(self.host.availability_occurrences.exists())
+
+
+class ScheduleModelTests(TestCase):
+    def test_schedule_model(self):
+        self.assertIs(User, routing.get_schedule_model(User))
+        self.assertIs(User, routing.get_schedule_model(proxy_model()))
+
+    def test_proxy(self):
+        """
+        Reads through a proxy instance see what was written for the schedule
+        """
+        signals.teardown()
+        user = User.objects.create(email="host@example.org", username="host")
+        availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            recurrence="RRULE:FREQ=DAILY",
+            schedule=user,
+            timezone=pytz.utc,
+        )
+        start = pytz.utc.localize(datetime(2010, 1, 4))
+        availability.recreate_occurrences(start, start + timedelta(days=1))
+        host = proxy_model().objects.get(pk=user.pk)
+        self.assertEqual(1, get_agenda_version(host))
+        self.assertEqual(get_agenda_version(user), get_agenda_version(host))
+        # past the generated horizon, so it has to find it
+        end = start + timedelta(days=3)
+        self.assertEqual(3, len(get_free_times(host, start, end)))
@@ -0,0 +1,94 @@
+import json
+import unittest
+from datetime import date, datetime, time
+
+import pytz
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from django_agenda import serializers
+from django_agenda.blackouts import blackout_cache
+from django_agenda.models import get_free_times, iter_free_times
+from django_agenda.time_span import TimeSpan
+from . import models, signals
+from .utils import utc
+
+
+class SerializerTests(SimpleTestCase):
+    def setUp(self):
+        self.spans = [
+            TimeSpan(utc(2020, 1, 1, 8), utc(2020, 1, 1, 9)),
+            TimeSpan(utc(2020, 1, 1, 10), utc(2020, 1, 1, 12)),
+        ]
+
+    def test_pairs(self):
+        data = serializers.encode_spans(self.spans, serializers.PAIRS)
+        self.assertEqual([[1577865600, 1577869200], [1577872800, 1577880000]], data)
+        self.assertEqual(self.spans, serializers.decode_spans(data))
+
+    def test_deltas(self):
+        data = serializers.encode_spans(self.spans, serializers.DELTAS)
+        self.assertEqual([1577865600, 3600, 3600, 7200], data)
+        self.assertEqual(
+            self.spans, serializers.decode_spans(data, serializers.DELTAS)
+        )
+
+    def test_local_times(self):
+        zone = pytz.timezone("America/Vancouver")
+        span = TimeSpan(zone.localize(datetime(2020, 1, 1)), self.spans[0].end)
+        data = serializers.encode_spans([span])
+        self.assertEqual([[1577865600, 1577869200]], data)
+
+    def test_stream_json(self):
+        for layout in (serializers.PAIRS, serializers.DELTAS):
+            streamed = b"".join(serializers.stream_json(iter(self.spans), layout))
+            self.assertEqual(serializers.dumps(self.spans, layout), streamed)
+            self.assertEqual(
+                serializers.encode_spans(self.spans, layout), json.loads(streamed)
+            )
+        self.assertEqual(b"[]", b"".join(serializers.stream_json([])))
+
+    @unittest.skipIf(serializers.msgpack is None, "msgpack isn't installed")
+    def test_stream_msgpack(self):
+        for layout in (serializers.PAIRS, serializers.DELTAS):
+            unpacker = serializers.msgpack.Unpacker(raw=False)
+            unpacker.feed(
+                b"".join(serializers.stream_msgpack(iter(self.spans), layout))
+            )
+            self.assertEqual(
+                serializers.encode_spans(self.spans, layout), list(unpacker)
+            )
+
+
+class StreamFreeTimesTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        guest = User.objects.create(email="guest@example.org", username="guest")
+        availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            recurrence="RRULE:FREQ=DAILY;COUNT=3",
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        availability.recreate_occurrences(utc(2010, 1, 1), utc(2010, 1, 10))
+        models.Booking.objects.create(
+            guest=guest, schedule=self.host, requested_time_1=utc(2010, 1, 5, 9)
+        )
+        models.Blackout.objects.create(
+            start=utc(2010, 1, 6), end=utc(2010, 1, 6, 10), all_schedules=True
+        )
+        blackout_cache.clear()
+
+    def test_iter_free_times(self):
+        start = utc(2010, 1, 1)
+        end = utc(2010, 1, 10)
+        free_times = get_free_times(self.host, start, end)
+        self.assertEqual(4, len(free_times))
+        self.assertEqual(free_times, list(iter_free_times(self.host, start, end)))
+        self.assertEqual(
+            serializers.dumps(free_times),
+            b"".join(serializers.stream_json(iter_free_times(self.host, start, end))),
+        )
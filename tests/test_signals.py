@@ -0,0 +1,125 @@
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+import pytz
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.utils.timezone import get_current_timezone
+
+from django_agenda.signals import OccurrenceRegenerator
+from . import models, signals
+
+
+def create_host():
+    return User.objects.create(email="host@example.org", username="host")
+
+
+class RegeneratorTestCase(TransactionTestCase):
+    def setUp(self):
+        # make sure the synchronous test handler isn't connected
+        signals.teardown()
+        self.host = create_host()
+        self.regenerator = OccurrenceRegenerator(models.Availability)
+        self.regenerator.connect()
+
+    def tearDown(self):
+        self.regenerator.disconnect()
+
+    def create_availability(self, hour):
+        return models.Availability.objects.create(
+            start_date=date.today(),
+            start_time=time(hour),
+            end_time=time(hour + 1),
+            recurrence="RRULE:FREQ=DAILY",
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+
+    def test_coalesced(self):
+        """
+        Saving an availability several times in one transaction only
+        regenerates it once, after commit
+        """
+        path = "tests.models.Availability.recreate_occurrences"
+        with mock.patch(path, autospec=True) as recreate:
+            with transaction.atomic():
+                first = self.create_availability(8)
+                second = self.create_availability(10)
+                first.save()
+                second.save()
+                self.assertEqual(recreate.call_count, 0)
+            self.assertEqual(recreate.call_count, 2)
+        self.assertEqual(
+            {first.pk, second.pk}, {c[0][0].pk for c in recreate.call_args_list}
+        )
+
+    def test_regenerates(self):
+        availability = self.create_availability(8)
+        self.assertTrue(availability.occurrences.exists())
+
+    def test_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.create_availability(8)
+                raise RuntimeError
+        self.assertFalse(models.AvailabilityOccurrence.objects.exists())
+
+    def test_executor(self):
+        executor = mock.Mock()
+        self.regenerator.executor = executor
+        with transaction.atomic():
+            self.create_availability(8)
+            self.create_availability(10)
+        # one job for the schedule
+        self.assertEqual(executor.submit.call_count, 1)
+        args = executor.submit.call_args[0]
+        self.assertEqual(args[1], "tests.Availability")
+        self.assertEqual(len(args[2]), 2)
+        self.assertFalse(models.AvailabilityOccurrence.objects.exists())
+
+    def exclude(self, availability, day):
+        """
+        Set the recurrence to exclude a day from now, and save it
+        """
+        excluded = datetime.combine(date.today() + timedelta(days=day), time(8))
+        # recurrence reads UTC dates in the current time zone
+        exdate = get_current_timezone().localize(excluded).astimezone(pytz.utc)
+        availability.recurrence = "RRULE:FREQ=DAILY\nEXDATE:{}".format(
+            exdate.strftime("%Y%m%dT%H%M%SZ")
+        )
+        availability.save()
+        return pytz.utc.localize(excluded)
+
+    def test_saved_again(self):
+        """
+        Saving the same instance in a later transaction compares it with
+        what the last save generated
+        """
+        availability = self.create_availability(8)
+        availability = models.Availability.objects.get(pk=availability.pk)
+        first = self.exclude(availability, 5)
+        self.assertFalse(availability.occurrences.filter(start=first).exists())
+        second = self.exclude(availability, 6)
+        self.assertTrue(availability.occurrences.filter(start=first).exists())
+        self.assertFalse(availability.occurrences.filter(start=second).exists())
+
+    def test_partial(self):
+        """
+        Adding an exclusion only regenerates the excluded date, even though
+        the regenerator re-reads the availability
+        """
+        availability = self.create_availability(8)
+        availability = models.Availability.objects.get(pk=availability.pk)
+        with mock.patch.object(
+            models.Availability,
+            "_sync_occurrences",
+            autospec=True,
+            side_effect=models.Availability._sync_occurrences,
+        ) as sync:
+            excluded = self.exclude(availability, 5)
+        # plus the little bit that the window moved along by
+        tail, exclusion = [c[0][1] for c in sync.call_args_list]
+        self.assertLess(tail.length, timedelta(minutes=1))
+        self.assertEqual((excluded, excluded), (exclusion.start, exclusion.end))
+        self.assertFalse(availability.occurrences.filter(start=excluded).exists())
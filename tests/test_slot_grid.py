@@ -0,0 +1,139 @@
+from datetime import date, time, timedelta
+
+import pytz
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from django_agenda.models import get_slot_grid, suggest_slots
+from . import models, signals
+from .utils import utc
+
+
+class SlotGridTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.host = User.objects.create(email="host@example.org", username="host")
+        guest = User.objects.create(email="guest@example.org", username="guest")
+        availability = models.Availability.objects.create(
+            start_date=date(2010, 1, 4),
+            start_time=time(8),
+            end_time=time(12),
+            recurrence="RRULE:FREQ=DAILY",
+            schedule=self.host,
+            timezone=pytz.utc,
+        )
+        availability.recreate_occurrences(utc(2010, 1, 4), utc(2010, 1, 6))
+        # busy from 9:30 to 11:30, including padding
+        self.booking = models.Booking.objects.create(
+            guest=guest, schedule=self.host, requested_time_1=utc(2010, 1, 4, 10)
+        )
+
+    def test_grid(self):
+        starts = get_slot_grid(
+            self.host,
+            utc(2010, 1, 4),
+            utc(2010, 1, 5),
+            duration=timedelta(minutes=30),
+            step=timedelta(minutes=15),
+            padding=timedelta(minutes=15),
+            timezone=pytz.utc,
+        )
+        self.assertEqual(
+            [
+                utc(2010, 1, 4, 8),
+                utc(2010, 1, 4, 8, 15),
+                utc(2010, 1, 4, 8, 30),
+                utc(2010, 1, 4, 8, 45),
+            ],
+            starts,
+        )
+
+    def test_packed(self):
+        grid = get_slot_grid(
+            self.host,
+            utc(2010, 1, 4),
+            utc(2010, 1, 6),
+            duration=timedelta(minutes=30),
+            step=timedelta(minutes=15),
+            padding=timedelta(minutes=15),
+            timezone=pytz.utc,
+            packed=True,
+        )
+        self.assertEqual({date(2010, 1, 4), date(2010, 1, 5)}, set(grid))
+        first = grid[date(2010, 1, 4)]
+        self.assertEqual(12, len(first))
+        # 8:00 is the 32nd quarter hour
+        self.assertEqual(b"\0\0\0\0\xf0" + b"\0" * 7, first)
+        # the whole morning, from 8:00 until 11:30
+        self.assertEqual(b"\0\0\0\0\xff\xfe" + b"\0" * 6, grid[date(2010, 1, 5)])
+
+    def test_local_alignment(self):
+        zone = pytz.timezone("America/St_Johns")
+        starts = get_slot_grid(
+            self.host,
+            utc(2010, 1, 5),
+            utc(2010, 1, 6),
+            duration=timedelta(minutes=30),
+            step=timedelta(hours=1),
+            timezone=zone,
+        )
+        # 8:00 UTC is 4:30 in St. John's
+        self.assertEqual(
+            [
+                utc(2010, 1, 5, 8, 30),
+                utc(2010, 1, 5, 9, 30),
+                utc(2010, 1, 5, 10, 30),
+                utc(2010, 1, 5, 11, 30),
+            ],
+            starts,
+        )
+
+    def test_suggestions(self):
+        # 8:00-9:30 is free, and 11:30-12:00 is too short
+        suggestions = suggest_slots(
+            self.host,
+            utc(2010, 1, 4),
+            utc(2010, 1, 5),
+            duration=timedelta(minutes=45),
+            step=timedelta(minutes=15),
+            timezone=pytz.utc,
+        )
+        self.assertEqual(
+            [
+                (utc(2010, 1, 4, 8), timedelta(0)),
+                (utc(2010, 1, 4, 8, 45), timedelta(0)),
+                (utc(2010, 1, 4, 8, 15), timedelta(minutes=45)),
+                (utc(2010, 1, 4, 8, 30), timedelta(minutes=45)),
+            ],
+            [(s.start, s.waste) for s in suggestions],
+        )
+        self.assertEqual(timedelta(minutes=45), suggestions[0].gap_after)
+        self.assertEqual(
+            suggestions[:2],
+            suggest_slots(
+                self.host,
+                utc(2010, 1, 4),
+                utc(2010, 1, 5),
+                duration=timedelta(minutes=45),
+                step=timedelta(minutes=15),
+                timezone=pytz.utc,
+                limit=2,
+            ),
+        )
+
+    def test_booking_suggestions(self):
+        # with 30 minutes of padding, starting at 8:30 fills the span
+        suggestions = self.booking.suggest_times(
+            utc(2010, 1, 4),
+            utc(2010, 1, 5),
+            duration=timedelta(minutes=30),
+            step=timedelta(minutes=30),
+            timezone=pytz.utc,
+        )
+        self.assertEqual(
+            [
+                (utc(2010, 1, 4, 8, 30), timedelta(0)),
+                (utc(2010, 1, 4, 8), timedelta(minutes=30)),
+            ],
+            [(s.start, s.waste) for s in suggestions],
+        )
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+
+from django_agenda.time_span import TimeSpan
+
+
+def span(start_hour, end_hour):
+    base = datetime(2020, 1, 1)
+    return TimeSpan(
+        base + timedelta(hours=start_hour), base + timedelta(hours=end_hour)
+    )
+
+
+class MergeTests(SimpleTestCase):
+    def test_merge(self):
+        spans = [span(10, 12), span(8, 9), span(9, 10), span(13, 14)]
+        self.assertEqual([span(8, 12), span(13, 14)], TimeSpan.merge_spans(spans))
+
+    def test_contained(self):
+        """
+        A span inside the previous one doesn't shorten it
+        """
+        spans = [span(8, 12), span(9, 10), span(11, 13)]
+        self.assertEqual([span(8, 13)], TimeSpan.merge_spans(spans))
+        self.assertEqual(
+            [span(8, 12)], TimeSpan.merge_spans([span(8, 12), span(9, 10)])
+        )
+
+    def test_sorted_generator(self):
+        spans = (s for s in [span(8, 9), span(8, 10), span(11, 12)])
+        merged = TimeSpan.merge_sorted_spans(spans)
+        self.assertEqual(span(8, 10), next(merged))
+        self.assertEqual([span(11, 12)], list(merged))
+        self.assertEqual([], list(TimeSpan.merge_sorted_spans([])))
+
+    def test_streams(self):
+        first = iter([span(8, 9), span(12, 13)])
+        second = iter([span(9, 10), span(14, 15)])
+        third = iter([span(12, 12.5)])
+        self.assertEqual(
+            [span(8, 10), span(12, 13), span(14, 15)],
+            list(TimeSpan.merge_span_streams(first, second, third)),
+        )
@@ -0,0 +1,108 @@
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+import pytz
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from django_agenda.utilization import DayUtilization, get_daily_utilization
+from . import models, signals
+
+
+class UtilizationTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        self.vancouver = pytz.timezone("America/Vancouver")
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.other = User.objects.create(email="other@example.org", username="other")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        for host, zone in ((self.host, self.vancouver), (self.other, pytz.utc)):
+            availability = models.Availability.objects.create(
+                start_date=date(2010, 1, 4),
+                start_time=time(8),
+                end_time=time(12),
+                recurrence="RRULE:FREQ=DAILY;COUNT=2",
+                schedule=host,
+                timezone=zone,
+            )
+            availability.recreate_occurrences(
+                pytz.utc.localize(datetime(2010, 1, 1)),
+                pytz.utc.localize(datetime(2010, 1, 10)),
+            )
+        booking = models.Booking(
+            guest=self.guest,
+            schedule=self.host,
+            requested_time_1=self.vancouver.localize(datetime(2010, 1, 5, 9)),
+        )
+        booking.save()
+
+    def get_timezone(self, schedule):
+        return self.vancouver if schedule == self.host else pytz.utc
+
+    def test_utilization(self):
+        # the blackouts are in the past, so they're read with a fourth query
+        with self.assertNumQueries(4):
+            result = get_daily_utilization(
+                [self.host, self.other],
+                date(2010, 1, 4),
+                date(2010, 1, 6),
+                get_timezone=self.get_timezone,
+            )
+        hours = timedelta(hours=1)
+        zero = timedelta(0)
+        self.assertEqual(
+            [date(2010, 1, 4), date(2010, 1, 5), date(2010, 1, 6)],
+            list(result[self.host.pk]),
+        )
+        self.assertEqual(
+            DayUtilization(4 * hours, zero, zero, 4 * hours),
+            result[self.host.pk][date(2010, 1, 4)],
+        )
+        # a one hour booking, with half an hour padding on each side
+        self.assertEqual(
+            DayUtilization(4 * hours, hours, hours, 2 * hours),
+            result[self.host.pk][date(2010, 1, 5)],
+        )
+        self.assertEqual(
+            DayUtilization(zero, zero, zero, zero),
+            result[self.host.pk][date(2010, 1, 6)],
+        )
+        self.assertEqual(
+            4 * hours, result[self.other.pk][date(2010, 1, 5)].available,
+        )
+
+    def test_local_days(self):
+        """
+        Days are split at midnight in the schedule's time zone
+        """
+        with mock.patch.object(User, "get_timezone", create=True) as get_timezone:
+            get_timezone.return_value = pytz.timezone("Asia/Tokyo")
+            result = get_daily_utilization(
+                [self.other], date(2010, 1, 4), date(2010, 1, 5)
+            )
+        # 8-12 UTC is 17-21 in Tokyo
+        self.assertEqual(
+            timedelta(hours=4), result[self.other.pk][date(2010, 1, 4)].free
+        )
+        self.assertEqual(
+            timedelta(hours=4), result[self.other.pk][date(2010, 1, 5)].free
+        )
+
+    def test_virtual(self):
+        with mock.patch.object(
+            models.Availability.AgendaMeta,
+            "materialize_occurrences",
+            False,
+            create=True,
+        ):
+            result = get_daily_utilization(
+                [self.host], date(2010, 1, 5), date(2010, 1, 5), self.get_timezone
+            )
+        self.assertEqual(
+            timedelta(hours=2), result[self.host.pk][date(2010, 1, 5)].free
+        )
+
+    def test_empty(self):
+        self.assertEqual(
+            {}, get_daily_utilization([], date(2010, 1, 4), date(2010, 1, 5))
+        )
@@ -0,0 +1,90 @@
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+import pytz
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from django_agenda.models import get_free_times
+from django_agenda.virtual import ExpansionCache, expansion_cache
+from . import models, signals
+
+
+def virtual_mode():
+    return mock.patch.object(
+        models.Availability.AgendaMeta, "materialize_occurrences", False, create=True,
+    )
+
+
+class VirtualOccurrenceTests(TestCase):
+    def setUp(self):
+        signals.teardown()
+        expansion_cache.clear()
+        self.timezone = pytz.timezone("America/Vancouver")
+        self.host = User.objects.create(email="host@example.org", username="host")
+        self.guest = User.objects.create(email="guest@example.org", username="guest")
+        self.availability = models.Availability.objects.create(
+            start_date=date(2018, 10, 1),
+            start_time=time(8),
+            end_time=time(15),
+            recurrence="RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR",
+            schedule=self.host,
+            timezone=self.timezone,
+        )
+        # across a daylight savings change
+        self.start = self.timezone.localize(datetime(2018, 10, 29, 12))
+        self.end = self.timezone.localize(datetime(2018, 11, 9, 12))
+
+    def test_same_as_stored(self):
+        self.availability.recreate_occurrences(self.start - timedelta(days=1), self.end)
+        expected = get_free_times(self.host, self.start, self.end)
+        with virtual_mode():
+            self.assertEqual(expected, get_free_times(self.host, self.start, self.end))
+            # and again, from the cache
+            self.assertEqual(expected, get_free_times(self.host, self.start, self.end))
+        self.assertEqual(6, len(expected))
+        first = self.timezone.localize(datetime(2018, 10, 29, 8))
+        last = self.timezone.localize(datetime(2018, 11, 9, 15))
+        self.assertEqual(first, expected[0].start)
+        self.assertEqual(last, expected[-1].end)
+
+    def test_nothing_stored(self):
+        with virtual_mode():
+            self.availability.recreate_occurrences(self.start, self.end)
+            self.assertFalse(self.host.availability_occurrences.exists())
+            self.assertEqual(6, len(get_free_times(self.host, self.start, self.end)))
+
+    def test_edit(self):
+        with virtual_mode():
+            get_free_times(self.host, self.start, self.end)
+            availability = models.Availability.objects.get(pk=self.availability.pk)
+            availability.recurrence = "RRULE:FREQ=WEEKLY;BYDAY=MO"
+            availability.save()
+            self.assertEqual(2, len(get_free_times(self.host, self.start, self.end)))
+
+    def test_clean(self):
+        booking_time = self.timezone.localize(datetime(2018, 11, 5, 9))
+        with virtual_mode():
+            booking = models.Booking(
+                guest=self.guest, schedule=self.host, requested_time_1=booking_time
+            )
+            booking.clean()
+            booking.save()
+            booking = models.Booking(
+                guest=self.guest,
+                schedule=self.host,
+                requested_time_1=booking_time + timedelta(days=1),
+            )
+            with self.assertRaises(ValidationError):
+                booking.clean()
+
+    def test_cache_size(self):
+        cache = ExpansionCache(max_size=2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        self.assertEqual("a", cache.get(1))
+        cache.set(3, "c")
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual("a", cache.get(1))
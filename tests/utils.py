@@ -0,0 +1,10 @@
+from datetime import datetime
+
+import pytz
+
+
+def utc(*args):
+    """
+    Return an aware UTC datetime, taking the same arguments as ``datetime``
+    """
+    return pytz.utc.localize(datetime(*args))